@@ -0,0 +1,134 @@
+import argparse
+import csv
+import os
+import time
+
+from ch_sql import read_sql_statements
+from gen_data import load_scale, make_client, run_suite
+
+# Старая (PARTITION BY category_id / vendor) и новая (без партиций, AggregatingMergeTree) схема
+# каталожных MV на одних и тех же синтетических данных: скорость вставки в ecom_offers,
+# число кусков в MV по system.parts и латентность MV-запросов из test.py
+LAYOUTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "clickhouse", "mv_layouts")
+MVS = ["catalog_by_category_mv", "catalog_by_brand_mv"]
+MV_QUERIES = ["mv_top_categories", "mv_top_brands", "mv_avg_offers_per_brand"]
+
+# Куски внутренней таблицы MV (.inner.<mv> или .inner_id.<uuid>); неактивные - это куски,
+# уже слитые мерджем, но ещё не удалённые
+MV_PARTS_SQL = """
+SELECT
+    countIf(active),
+    uniqExactIf(partition_id, active),
+    countIf(NOT active),
+    sumIf(rows, active)
+FROM system.parts
+WHERE database = currentDatabase()
+  AND table IN (
+      SELECT concat('.inner.', %(table)s)
+      UNION ALL
+      SELECT concat('.inner_id.', toString(uuid))
+      FROM system.tables
+      WHERE database = currentDatabase() AND name = %(table)s
+  )
+"""
+
+
+def apply_layout(args, layout: str) -> None:
+    client = make_client(args)
+    for st in read_sql_statements(os.path.join(LAYOUTS_DIR, layout + ".sql")):
+        client.execute(st)
+    client.disconnect()
+
+
+def mv_parts(args) -> dict:
+    client = make_client(args)
+    out = {}
+    for mv in MVS:
+        active, partitions, inactive, rows = client.execute(MV_PARTS_SQL, {"table": mv})[0]
+        out[mv] = {"parts": active, "partitions": partitions, "inactive": inactive, "rows": rows}
+    client.disconnect()
+    return out
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Partitioned vs unpartitioned catalog MVs: inserts, parts, latency")
+    ap.add_argument("--layouts", nargs="+", default=["partitioned", "aggregating"],
+                    help="files from clickhouse/mv_layouts")
+    ap.add_argument("--scales", type=float, nargs="+", default=[1.0, 10.0, 100.0])
+    ap.add_argument("--settle", type=float, default=30.0, help="seconds to let background merges run before querying")
+    ap.add_argument("--iterations", type=int, default=10, help="iterations per MV query")
+    ap.add_argument("--out-dir", default="mv_layouts", help="test.py results per layout/scale and the summary csv")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--days", type=int, default=30)
+    ap.add_argument("--workers", type=int, default=4, help="parallel generator/insert processes")
+    ap.add_argument("--block-size", type=int, default=500_000, help="rows per INSERT block")
+    ap.add_argument("--host", default="localhost")
+    ap.add_argument("--port", type=int, default=9000)
+    ap.add_argument("--database", default="ecom")
+    ap.add_argument("--user", default="default")
+    ap.add_argument("--password", default="")
+    ap.add_argument("--truncate", action="store_true",
+                    help="required: ecom_offers and the catalog MVs are truncated before each scale")
+    ap.add_argument("--bench-user", default="benchmark", help="user test.py measures as (same host/port/database)")
+    ap.add_argument("--bench-password", default="")
+    args = ap.parse_args()
+    if not args.truncate:
+        ap.error("the benchmark reloads ecom_offers at every scale and truncates it and the catalog MVs first: "
+                 "pass --truncate to confirm (raw_events and the event MVs are left alone)")
+    # старой схеме нужны вставки с тысячами партиций
+    args.max_partitions_per_insert_block = 0
+
+    rows = []
+    current = "aggregating"  # None - схема применена не до конца
+    try:
+        for layout in args.layouts:
+            print(f"\n##### MV layout: {layout} #####")
+            current = None
+            apply_layout(args, layout)
+            current = layout
+            for scale in args.scales:
+                stats = load_scale(args, scale, tables=("ecom_offers",), truncate=["ecom_offers", *MVS])
+                after_insert = mv_parts(args)
+                time.sleep(args.settle)
+                settled = mv_parts(args)
+                medians = run_suite(args, scale, queries=MV_QUERIES, prefix=f"{layout}_scale")
+
+                row = {"layout": layout, "scale": scale, "offers": stats["offers"],
+                       "insert_rows_per_sec": stats["ecom_offers_rows_per_sec"]}
+                for mv in MVS:
+                    short = mv.replace("catalog_by_", "").replace("_mv", "")
+                    row[f"{short}_parts"] = after_insert[mv]["parts"]
+                    row[f"{short}_partitions"] = after_insert[mv]["partitions"]
+                    row[f"{short}_parts_settled"] = settled[mv]["parts"]
+                    row[f"{short}_rows_settled"] = settled[mv]["rows"]
+                row.update(medians)
+                rows.append(row)
+
+                print(f"  insert {row['insert_rows_per_sec']:,} rows/s; parts after insert / after {args.settle:g} s: "
+                      + ", ".join(f"{mv} {after_insert[mv]['parts']:,} / {settled[mv]['parts']:,} "
+                                  f"({after_insert[mv]['partitions']:,} partitions)" for mv in MVS))
+    finally:
+        # Стенд остаётся на схеме из init.sql, в том числе после ошибки / Ctrl-C посреди прогона
+        if current != "aggregating":
+            apply_layout(args, "aggregating")
+
+    print(f"\n{'layout':<14} {'scale':>7} {'rows/s':>12} {'cat parts':>10} {'brand parts':>12} {'brand settled':>14}"
+          + "".join(f" {q:>24}" for q in MV_QUERIES))
+    for r in rows:
+        print(f"{r['layout']:<14} {r['scale']:>7g} {r['insert_rows_per_sec']:>12,} {r['category_parts']:>10,} "
+              f"{r['brand_parts']:>12,} {r['brand_parts_settled']:>14,}"
+              + "".join(f" {r.get(q, float('nan')):>24.4f}" for q in MV_QUERIES))
+
+    if not rows:
+        raise SystemExit("No results: no layouts or scales were run")
+    os.makedirs(args.out_dir, exist_ok=True)
+    path = os.path.join(args.out_dir, "mv_layouts.csv")
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.DictWriter(f, fieldnames=list(rows[0]))
+        w.writeheader()
+        w.writerows(rows)
+    print("Results saved to:", path)
+
+
+if __name__ == "__main__":
+    main()
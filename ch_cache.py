@@ -0,0 +1,195 @@
+import json
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+# Кэш результатов запросов к ClickHouse для дашбордных top-N запросов (MV_TOP_CATEGORIES, MV_TOP_BRANDS, ...).
+#
+#   cache = QueryCache(ttl=300, max_bytes=256 * 2**20)
+#   rows = cache.execute(client, MV_TOP_BRANDS)
+#
+# Один QueryCache можно делить между потоками; client у каждого потока свой (Client не потокобезопасен).
+# Результаты из кэша общие для всех - их нельзя менять на месте.
+
+_WHITESPACE = re.compile(r"\s+")
+_SOURCE_TABLE = re.compile(r"\b(?:FROM|JOIN)\s+([A-Za-z_][\w.]*)", re.IGNORECASE)
+
+# Версия источника: новые вставки увеличивают max_block_number, TRUNCATE/DROP PARTITION меняют
+# набор партиций, max_date - это max(snapshot_date) для ecom_offers. Мерджи версию не меняют.
+# У MV данные лежат во внутренней таблице .inner.<mv> / .inner_id.<uuid>, её тоже учитываем
+TABLE_VERSION_SQL = """
+SELECT
+    max(max_block_number),
+    arraySort(groupUniqArray(partition_id)),
+    max(max_date)
+FROM system.parts
+WHERE active
+  AND database = currentDatabase()
+  AND table IN (
+      SELECT %(table)s
+      UNION ALL
+      SELECT concat('.inner.', %(table)s)
+      UNION ALL
+      SELECT concat('.inner_id.', toString(uuid))
+      FROM system.tables
+      WHERE database = currentDatabase() AND name = %(table)s
+  )
+"""
+
+
+def normalize_sql(sql: str) -> str:
+    return _WHITESPACE.sub(" ", sql).strip().rstrip(";").strip()
+
+
+def source_tables(sql: str) -> list:
+    return sorted({name.split(".")[-1] for name in _SOURCE_TABLE.findall(sql)})
+
+
+def estimate_size(result) -> int:
+    # Грубая оценка памяти под list of tuples: считаем по первым 100 строкам и экстраполируем
+    if not isinstance(result, list) or not result:
+        return sys.getsizeof(result)
+    sample = result[:100]
+    per_row = sum(sys.getsizeof(r) + sum(sys.getsizeof(v) for v in r) for r in sample) / len(sample)
+    return int(sys.getsizeof(result) + per_row * len(result))
+
+
+class _Entry:
+    __slots__ = ("result", "size", "expires", "versions")
+
+    def __init__(self, result, size: int, expires: float, versions: dict):
+        self.result = result
+        self.size = size
+        self.expires = expires
+        self.versions = versions
+
+
+class _Flight:
+    # Запрос, который прямо сейчас выполняется: остальные с тем же ключом ждут его результат
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class QueryCache:
+    def __init__(self, ttl: float = 60.0, max_bytes: int = 64 * 2 ** 20, version_check_interval: float = 1.0):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.version_check_interval = version_check_interval
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._versions = {}
+        self.bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def make_key(sql: str, params=None) -> str:
+        return normalize_sql(sql) + "\x00" + json.dumps(params, sort_keys=True, default=str)
+
+    def _table_version(self, client, table: str):
+        now = time.monotonic()
+        cached = self._versions.get(table)
+        if cached is not None and now - cached[0] < self.version_check_interval:
+            return cached[1]
+        row = client.execute(TABLE_VERSION_SQL, {"table": table})[0]
+        version = (row[0], tuple(row[1]), str(row[2]))
+        self._versions[table] = (now, version)
+        return version
+
+    def _current_versions(self, client, sql: str) -> dict:
+        return {t: self._table_version(client, t) for t in source_tables(sql)}
+
+    def _store(self, key: str, result, versions: dict) -> None:
+        size = estimate_size(result)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old.size
+            self._entries[key] = _Entry(result, size, time.monotonic() + self.ttl, versions)
+            self.bytes += size
+            # LRU: выкидываем самые давно использованные, пока не влезем в бюджет
+            while self.bytes > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self.bytes -= evicted.size
+                self.evictions += 1
+
+    def execute(self, client, sql: str, params=None):
+        key = self.make_key(sql, params)
+        versions = self._current_versions(client, sql)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry.expires > time.monotonic() and entry.versions == versions:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry.result
+                # протух по TTL или в источнике появились новые данные
+                del self._entries[key]
+                self.bytes -= entry.size
+                self.invalidations += 1
+
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._inflight[key] = flight
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = client.execute(sql, params)
+            self._store(key, flight.result, versions)
+            return flight.result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            flight.event.set()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._versions.clear()
+            self.bytes = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses + self.coalesced
+        # ожидание чужого запроса в single-flight тоже не ходит в ClickHouse
+        return (self.hits + self.coalesced) / total if total else 0.0
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "hit_ratio": round(self.hit_ratio, 4),
+        }
@@ -0,0 +1,5 @@
+def read_sql_statements(path: str) -> list:
+    # .sql-файл -> список операторов: строки-комментарии "--" выбрасываются, операторы режутся по ";"
+    with open(path, encoding="utf-8") as f:
+        lines = [line for line in f if not line.lstrip().startswith("--")]
+    return [st.strip() for st in "".join(lines).split(";") if st.strip()]
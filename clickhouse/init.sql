@@ -13,7 +13,9 @@ CREATE TABLE IF NOT EXISTS ecom_offers
 )
 ENGINE = ReplacingMergeTree(snapshot_date)
 PARTITION BY toYYYYMM(snapshot_date)
-ORDER BY (category_id, offer_id);
+-- intHash32(offer_id) в ключе - для SAMPLE в приближённых запросах; offer_id остаётся в ключе дедупликации
+ORDER BY (category_id, intHash32(offer_id), offer_id)
+SAMPLE BY intHash32(offer_id);
 
 CREATE TABLE IF NOT EXISTS raw_events
 (
@@ -49,9 +51,15 @@ SELECT
     ContentUnitID
 FROM file('/data/RawEvent.parquet', 'Parquet');
 
+-- Каталожные MV без PARTITION BY: партиция на каждую категорию / бренд превращала каждую
+-- вставку в тысячи крошечных кусков. До мерджа у одного ключа может быть несколько строк,
+-- поэтому читаем их только через sum(offers_cnt) ... GROUP BY
 CREATE MATERIALIZED VIEW IF NOT EXISTS catalog_by_category_mv
-ENGINE = SummingMergeTree
-PARTITION BY category_id
+(
+    category_id UInt32,
+    offers_cnt  SimpleAggregateFunction(sum, UInt64)
+)
+ENGINE = AggregatingMergeTree
 ORDER BY category_id
 AS
 SELECT
@@ -61,8 +69,12 @@ FROM ecom_offers
 GROUP BY category_id;
 
 CREATE MATERIALIZED VIEW IF NOT EXISTS catalog_by_brand_mv
-ENGINE = SummingMergeTree
-PARTITION BY vendor
+(
+    vendor      String,
+    category_id UInt32,
+    offers_cnt  SimpleAggregateFunction(sum, UInt64)
+)
+ENGINE = AggregatingMergeTree
 ORDER BY (vendor, category_id)
 AS
 SELECT
@@ -72,26 +84,45 @@ SELECT
 FROM ecom_offers
 GROUP BY vendor, category_id;
 
-CREATE MATERIALIZED VIEW IF NOT EXISTS offer_events_mv
-ENGINE = SummingMergeTree
-PARTITION BY toDate(Hour)
-ORDER BY (offer_id)
+-- offer_events_mv (INNER JOIN raw_events с ecom_offers на каждую вставку) заменён offer_last_seen ниже
+DROP VIEW IF EXISTS offer_events_mv;
+
+-- "Когда оффер видели последний раз": считается прямо из raw_events, без JOIN с ecom_offers
+-- на каждую вставку. Одна строка на offer_id после мерджей, так что отчёт "товары без событий"
+-- сводится к NOT IN по компактному набору ключей, а не к DISTINCT по всем событиям
+CREATE TABLE IF NOT EXISTS offer_last_seen
+(
+    offer_id   UInt64,
+    last_seen  SimpleAggregateFunction(max, DateTime),
+    events_cnt SimpleAggregateFunction(sum, UInt64)
+)
+ENGINE = AggregatingMergeTree
+ORDER BY offer_id;
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS offer_last_seen_mv
+TO offer_last_seen
 AS
 SELECT
-    toDate(r.Hour) AS event_date,
-    e.offer_id     AS offer_id,
-    e.category_id  AS category_id,
-    e.vendor       AS vendor,
-    count()        AS events_cnt
-FROM raw_events AS r
-INNER JOIN ecom_offers AS e
-    ON r.ContentUnitID = e.offer_id
-GROUP BY event_date, offer_id, category_id, vendor;
+    ContentUnitID AS offer_id,
+    max(Hour)     AS last_seen,
+    count()       AS events_cnt
+FROM raw_events
+GROUP BY offer_id;
+
+-- События, залитые выше до создания MV
+INSERT INTO offer_last_seen (offer_id, last_seen, events_cnt)
+SELECT
+    ContentUnitID AS offer_id,
+    max(Hour)     AS last_seen,
+    count()       AS events_cnt
+FROM raw_events
+GROUP BY offer_id;
 
 SELECT
     category_id,
-    offers_cnt
+    sum(offers_cnt) AS offers_cnt
 FROM catalog_by_category_mv
+GROUP BY category_id
 ORDER BY offers_cnt DESC
 LIMIT 20;
 
@@ -128,8 +159,16 @@ ORDER BY avg_offers_per_brand DESC;
 
 SELECT
     category_id,
-    avg(offers_cnt) AS avg_offers_per_brand
-FROM catalog_by_brand_mv
+    avg(offers_per_brand) AS avg_offers_per_brand
+FROM
+(
+    SELECT
+        category_id,
+        vendor,
+        sum(offers_cnt) AS offers_per_brand
+    FROM catalog_by_brand_mv
+    GROUP BY category_id, vendor
+)
 GROUP BY category_id
 ORDER BY avg_offers_per_brand DESC;
 
@@ -152,9 +191,8 @@ SELECT
     o.vendor,
     o.price
 FROM ecom_offers AS o
-LEFT JOIN
+WHERE o.offer_id NOT IN
 (
-    SELECT DISTINCT offer_id
-    FROM offer_events_mv
-) AS ev USING (offer_id)
-WHERE ev.offer_id IS NULL;
+    SELECT offer_id
+    FROM offer_last_seen
+);
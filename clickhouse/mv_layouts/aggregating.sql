@@ -0,0 +1,33 @@
+-- Текущая схема из init.sql: без партиций, AggregatingMergeTree + SimpleAggregateFunction(sum)
+DROP VIEW IF EXISTS catalog_by_category_mv SYNC;
+DROP VIEW IF EXISTS catalog_by_brand_mv SYNC;
+
+CREATE MATERIALIZED VIEW catalog_by_category_mv
+(
+    category_id UInt32,
+    offers_cnt  SimpleAggregateFunction(sum, UInt64)
+)
+ENGINE = AggregatingMergeTree
+ORDER BY category_id
+AS
+SELECT
+    category_id,
+    count() AS offers_cnt
+FROM ecom_offers
+GROUP BY category_id;
+
+CREATE MATERIALIZED VIEW catalog_by_brand_mv
+(
+    vendor      String,
+    category_id UInt32,
+    offers_cnt  SimpleAggregateFunction(sum, UInt64)
+)
+ENGINE = AggregatingMergeTree
+ORDER BY (vendor, category_id)
+AS
+SELECT
+    vendor,
+    category_id,
+    count() AS offers_cnt
+FROM ecom_offers
+GROUP BY vendor, category_id;
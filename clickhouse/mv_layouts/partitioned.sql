@@ -0,0 +1,28 @@
+-- Старая схема каталожных MV: партиция на каждую категорию / бренд.
+-- Вставка блока с N разными брендами создаёт N кусков в catalog_by_brand_mv,
+-- поэтому для вставок нужен max_partitions_per_insert_block = 0
+DROP VIEW IF EXISTS catalog_by_category_mv SYNC;
+DROP VIEW IF EXISTS catalog_by_brand_mv SYNC;
+
+CREATE MATERIALIZED VIEW catalog_by_category_mv
+ENGINE = SummingMergeTree
+PARTITION BY category_id
+ORDER BY category_id
+AS
+SELECT
+    category_id,
+    count() AS offers_cnt
+FROM ecom_offers
+GROUP BY category_id;
+
+CREATE MATERIALIZED VIEW catalog_by_brand_mv
+ENGINE = SummingMergeTree
+PARTITION BY vendor
+ORDER BY (vendor, category_id)
+AS
+SELECT
+    vendor,
+    category_id,
+    count() AS offers_cnt
+FROM ecom_offers
+GROUP BY vendor, category_id;
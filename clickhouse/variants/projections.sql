@@ -0,0 +1,26 @@
+-- ecom_offers отсортирован по (category_id, ...), запросам с группировкой по vendor
+-- (RAW_TOP_BRANDS, RAW_AVG_OFFERS_PER_BRAND) это ничего не даёт. Агрегатная проекция
+-- по (vendor, category_id) отвечает на них без чтения всей таблицы.
+-- Проекции на ReplacingMergeTree требуют явного режима для мерджей
+ALTER TABLE ecom_offers MODIFY SETTING deduplicate_merge_projection_mode = 'rebuild';
+
+ALTER TABLE ecom_offers ADD PROJECTION IF NOT EXISTS vendor_agg
+(
+    SELECT
+        vendor,
+        category_id,
+        count()
+    GROUP BY vendor, category_id
+);
+
+ALTER TABLE ecom_offers MATERIALIZE PROJECTION vendor_agg;
+
+-- raw_events отсортирован по (Hour, ContentUnitID): поиск по ContentUnitID читает все партиции
+-- целиком. Проекция с сортировкой по ContentUnitID превращает его в чтение по ключу
+ALTER TABLE raw_events ADD PROJECTION IF NOT EXISTS by_content_unit
+(
+    SELECT *
+    ORDER BY ContentUnitID
+);
+
+ALTER TABLE raw_events MATERIALIZE PROJECTION by_content_unit;
@@ -0,0 +1,7 @@
+-- Возврат к схеме из init.sql: снимаем всё, что добавляют варианты.
+-- test.py --mode variants применяет этот файл перед каждым вариантом
+ALTER TABLE ecom_offers DROP PROJECTION IF EXISTS vendor_agg;
+ALTER TABLE raw_events DROP PROJECTION IF EXISTS by_content_unit;
+ALTER TABLE raw_events DROP INDEX IF EXISTS idx_content_unit_bf;
+-- режим мерджа проекций задаёт projections.sql, снимаем его после самих проекций
+ALTER TABLE ecom_offers RESET SETTING deduplicate_merge_projection_mode;
@@ -0,0 +1,5 @@
+-- Дешевле проекции по диску: bloom filter по ContentUnitID позволяет пропускать гранулы
+-- raw_events, в которых искомого оффера точно нет
+ALTER TABLE raw_events ADD INDEX IF NOT EXISTS idx_content_unit_bf ContentUnitID TYPE bloom_filter(0.01) GRANULARITY 1;
+
+ALTER TABLE raw_events MATERIALIZE INDEX idx_content_unit_bf;
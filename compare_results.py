@@ -0,0 +1,168 @@
+import argparse
+import json
+import math
+import random
+import sys
+from statistics import median
+
+
+def load_results(path: str) -> tuple:
+    header = {}
+    queries = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            rec = json.loads(line)
+            if rec.get("type") == "run":
+                header = rec
+            else:
+                queries[rec["key"]] = rec
+    return header, queries
+
+
+def histogram_percentile(hist: dict, p: float) -> float:
+    # Перцентиль по гистограмме из записи (test.py --histogram, LatencyHistogram.to_dict):
+    # верхняя граница корзины, не больше реального максимума
+    count = hist.get("count", 0)
+    if not count:
+        return float("nan")
+    rank = max(1, math.ceil(p / 100.0 * count))
+    log_base = math.log1p(hist["precision"])
+    seen = 0
+    for idx, c in sorted((int(k), v) for k, v in hist["counts"].items()):
+        seen += c
+        if seen >= rank:
+            return min(hist["max"], hist["lowest"] * math.exp((idx + 1) * log_base))
+    return hist["max"]
+
+
+def record_median(rec: dict, metric: str = "latencies") -> float:
+    # Медиана записи: по сырым замерам или, если прогон шёл с --histogram, по гистограмме
+    if rec.get(metric):
+        return median(rec[metric])
+    if metric == "latencies" and rec.get("histogram"):
+        return histogram_percentile(rec["histogram"], 50)
+    return float("nan")
+
+
+def mann_whitney_p(a: list, b: list) -> float:
+    # Двусторонний U-тест Манна-Уитни, нормальная аппроксимация с поправкой на связки.
+    # Для 30+ итераций на запрос этого достаточно, scipy не нужен
+    n1, n2 = len(a), len(b)
+    if n1 == 0 or n2 == 0:
+        return float("nan")
+    combined = sorted([(x, 0) for x in a] + [(x, 1) for x in b])
+    ranks = [0.0] * len(combined)
+    ties = 0.0
+    i = 0
+    while i < len(combined):
+        j = i
+        while j + 1 < len(combined) and combined[j + 1][0] == combined[i][0]:
+            j += 1
+        for k in range(i, j + 1):
+            ranks[k] = (i + j) / 2.0 + 1
+        t = j - i + 1
+        ties += t ** 3 - t
+        i = j + 1
+
+    r1 = sum(r for r, (_, g) in zip(ranks, combined) if g == 0)
+    u1 = r1 - n1 * (n1 + 1) / 2.0
+    mu = n1 * n2 / 2.0
+    n = n1 + n2
+    sigma = math.sqrt(n1 * n2 / 12.0 * ((n + 1) - ties / (n * (n - 1))))
+    if sigma == 0:
+        return 1.0
+    z = (abs(u1 - mu) - 0.5) / sigma
+    return math.erfc(max(z, 0.0) / math.sqrt(2))
+
+
+def bootstrap_ratio_ci(a: list, b: list, resamples: int = 2000, conf: float = 0.95, seed: int = 42) -> tuple:
+    # Доверительный интервал для median(b) / median(a)
+    rnd = random.Random(seed)
+    ratios = []
+    for _ in range(resamples):
+        ma = median(rnd.choices(a, k=len(a)))
+        mb = median(rnd.choices(b, k=len(b)))
+        if ma > 0:
+            ratios.append(mb / ma)
+    ratios.sort()
+    lo = ratios[int((1 - conf) / 2 * len(ratios))]
+    hi = ratios[min(len(ratios) - 1, int((1 + conf) / 2 * len(ratios)))]
+    return lo, hi
+
+
+def compare(base: dict, new: dict, metric: str, alpha: float, threshold: float) -> tuple:
+    # -> (rows, skipped): skipped - ключи из обоих прогонов, которые нечем сравнить, с причиной
+    rows, skipped = [], []
+    for key in sorted(set(base) & set(new)):
+        a = base[key].get(metric) or []
+        b = new[key].get(metric) or []
+        if metric == "latencies" and (base[key].get("histogram") or new[key].get("histogram")):
+            # --histogram хранит только корзины: сырых замеров для U-теста и bootstrap нет,
+            # поэтому сравниваем лишь медианы (точность гистограммы ~1%) и без вердикта
+            ma, mb = record_median(base[key]), record_median(new[key])
+            if math.isnan(ma) or math.isnan(mb):
+                skipped.append((key, "no samples"))
+                continue
+            rows.append({"key": key, "base": ma, "new": mb, "ratio": mb / ma if ma > 0 else float("nan"),
+                         "ci": None, "p": None, "verdict": "histogram, not tested"})
+            continue
+        if len(a) < 2 or len(b) < 2:
+            skipped.append((key, f"no {metric}" if not a or not b else "fewer than 2 samples"))
+            continue
+        ma, mb = median(a), median(b)
+        p = mann_whitney_p(a, b)
+        lo, hi = bootstrap_ratio_ci(a, b)
+        # Регрессия: разница статистически значима И весь CI отношения медиан выше порога
+        if p < alpha and lo > 1 + threshold:
+            verdict = "REGRESSION"
+        elif p < alpha and hi < 1 - threshold:
+            verdict = "improvement"
+        else:
+            verdict = "same"
+        rows.append({"key": key, "base": ma, "new": mb, "ratio": mb / ma if ma > 0 else float("nan"),
+                     "ci": (lo, hi), "p": p, "verdict": verdict})
+    return rows, skipped
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Compare two test.py result files (.jsonl)")
+    ap.add_argument("base", help="baseline run, e.g. clickhouse_load_test_20251217_182054.jsonl")
+    ap.add_argument("new", help="run to check for regressions")
+    ap.add_argument("--metric", choices=["latencies", "server_latencies"], default="latencies")
+    ap.add_argument("--alpha", type=float, default=0.01, help="significance level for Mann-Whitney U")
+    ap.add_argument("--threshold", type=float, default=0.05,
+                    help="ignore changes smaller than this fraction of the baseline median")
+    args = ap.parse_args()
+
+    base_header, base = load_results(args.base)
+    new_header, new = load_results(args.new)
+
+    print(f"base: {args.base} (commit {base_header.get('git_commit')}, server {base_header.get('server_version')})")
+    print(f"new:  {args.new} (commit {new_header.get('git_commit')}, server {new_header.get('server_version')})")
+    if base_header.get("config_fingerprint") != new_header.get("config_fingerprint"):
+        print("WARNING: server config/schema fingerprint differs between runs")
+
+    only = sorted(set(base) ^ set(new))
+    if only:
+        print("Not in both runs:", ", ".join(only))
+
+    rows, skipped = compare(base, new, args.metric, args.alpha, args.threshold)
+    print(f"\n{'query':<50} {'base p50':>10} {'new p50':>10} {'ratio':>7} {'95% CI':>15} {'p-value':>9}  verdict")
+    for r in rows:
+        ci = f"{r['ci'][0]:.2f}..{r['ci'][1]:.2f}" if r["ci"] else "-"
+        p = f"{r['p']:.4f}" if r["p"] is not None else "-"
+        print(f"{r['key']:<50} {r['base']:>10.4f} {r['new']:>10.4f} {r['ratio']:>7.2f} {ci:>15} {p:>9}  {r['verdict']}")
+    if skipped:
+        print("\nNot comparable:", ", ".join(f"{key} ({why})" for key, why in skipped))
+
+    regressions = [r for r in rows if r["verdict"] == "REGRESSION"]
+    tested = [r for r in rows if r["p"] is not None]
+    print(f"\n{len(regressions)} regression(s) out of {len(tested)} tested queries"
+          + (f" ({len(rows) - len(tested)} histogram-only, median ratio without a test)" if len(tested) < len(rows) else ""))
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
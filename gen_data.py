@@ -0,0 +1,260 @@
+import argparse
+import csv
+import datetime
+import json
+import math
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from clickhouse_driver import Client
+
+from compare_results import record_median
+
+try:
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+except ImportError:
+    plt = None
+
+# Размер исходного датасета = scale 1; все объёмы умножаются на --scale
+BASE_OFFERS = 100_000
+BASE_EVENTS = 1_000_000
+N_CATEGORIES = 5_000
+BASE_VENDORS = 20_000
+BASE_SELLERS = 2_000
+CATEGORY_ID_BASE = 10_000
+
+EVENTS_START = datetime.datetime(2025, 10, 1)
+DEVICE_TYPES = np.array(["mobile", "desktop", "tablet"], dtype=object)
+DEVICE_P = [0.65, 0.3, 0.05]
+APPLICATIONS = np.array(["app", "web", "mobile_web"], dtype=object)
+APPLICATION_P = [0.5, 0.3, 0.2]
+OS_NAMES = np.array(["Android", "iOS", "Windows", "macOS", "Linux"], dtype=object)
+OS_P = [0.45, 0.25, 0.2, 0.07, 0.03]
+PROVINCES = np.array(["Москва", "Санкт-Петербург", "Новосибирская область", "Свердловская область",
+                      "Краснодарский край", "Республика Татарстан", "Нижегородская область"], dtype=object)
+PROVINCE_P = [0.3, 0.15, 0.1, 0.1, 0.15, 0.1, 0.1]
+
+TABLES = ["ecom_offers", "raw_events", "catalog_by_category_mv", "catalog_by_brand_mv", "offer_last_seen"]
+
+
+def sizes(scale: float, days: int) -> dict:
+    return {
+        "offers": int(BASE_OFFERS * scale),
+        "events": int(BASE_EVENTS * scale),
+        # бренды и продавцы растут медленнее каталога, категории фиксированы
+        "vendors": int(BASE_VENDORS * scale ** 0.5),
+        "sellers": int(BASE_SELLERS * scale ** 0.5),
+        "categories": N_CATEGORIES,
+        "days": days,
+    }
+
+
+def zipf_cdf(n: int, s: float) -> np.ndarray:
+    cdf = np.cumsum(np.arange(1, n + 1, dtype=np.float64) ** -s)
+    return cdf / cdf[-1]
+
+
+def bounded_zipf(rng: np.random.Generator, a: float, n: int, size: int) -> np.ndarray:
+    # Для миллионов офферов таблица CDF не влезет в память, поэтому numpy zipf + отбрасывание хвоста > n
+    out = rng.zipf(a, size)
+    bad = out > n
+    while bad.any():
+        out[bad] = rng.zipf(a, int(bad.sum()))
+        bad = out > n
+    return out - 1
+
+
+def scatter(ranks: np.ndarray, n: int) -> np.ndarray:
+    # Ранг популярности -> id: биекция на [0, n), чтобы горячие офферы не шли подряд
+    return (ranks.astype(np.uint64) * np.uint64(2654435761) + np.uint64(12345)) % np.uint64(n)
+
+
+def gen_offers(seed: int, chunk: int, start: int, count: int, sz: dict) -> list:
+    # Отдельный генератор на чанк: результат не зависит от числа процессов и порядка
+    rng = np.random.default_rng([seed, 0, chunk])
+    offer_id = np.arange(start, start + count, dtype=np.uint64)
+    price = np.round(rng.lognormal(6.5, 1.2, count), 2)
+    seller_id = scatter(np.searchsorted(zipf_cdf(sz["sellers"], 1.1), rng.random(count), side="right"), sz["sellers"])
+    category_id = CATEGORY_ID_BASE + scatter(
+        np.searchsorted(zipf_cdf(sz["categories"], 1.0), rng.random(count), side="right"), sz["categories"])
+    vendor = np.searchsorted(zipf_cdf(sz["vendors"], 1.05), rng.random(count), side="right")
+    return [
+        offer_id.tolist(),
+        price.tolist(),
+        seller_id.tolist(),
+        category_id.astype(np.uint32).tolist(),
+        [f"brand_{v}" for v in vendor.tolist()],
+    ]
+
+
+def gen_events(seed: int, chunk: int, count: int, sz: dict) -> list:
+    rng = np.random.default_rng([seed, 1, chunk])
+    hours = rng.integers(0, sz["days"] * 24, count)
+    hour = (np.datetime64(EVENTS_START, "h") + hours.astype("timedelta64[h]")).astype("datetime64[s]")
+    # Горячие офферы: zipf по рангу популярности, длинный хвост остаётся без событий
+    offer = scatter(bounded_zipf(rng, 1.2, sz["offers"], count), sz["offers"])
+    return [
+        hour.tolist(),
+        rng.choice(DEVICE_TYPES, count, p=DEVICE_P).tolist(),
+        rng.choice(APPLICATIONS, count, p=APPLICATION_P).tolist(),
+        rng.choice(OS_NAMES, count, p=OS_P).tolist(),
+        rng.choice(PROVINCES, count, p=PROVINCE_P).tolist(),
+        offer.tolist(),
+    ]
+
+
+def make_client(args) -> Client:
+    return Client(host=args.host, port=args.port, database=args.database, user=args.user, password=args.password)
+
+
+def _insert_chunk(args, table: str, chunk: int, sz: dict) -> int:
+    client = make_client(args)
+    start = chunk * args.block_size
+    if table == "ecom_offers":
+        count = min(args.block_size, sz["offers"] - start)
+        data = gen_offers(args.seed, chunk, start, count, sz)
+        sql = "INSERT INTO ecom_offers (offer_id, price, seller_id, category_id, vendor) VALUES"
+    else:
+        count = min(args.block_size, sz["events"] - start)
+        data = gen_events(args.seed, chunk, count, sz)
+        sql = "INSERT INTO raw_events (Hour, DeviceTypeName, ApplicationName, OSName, ProvinceName, ContentUnitID) VALUES"
+    settings = {}
+    if args.max_partitions_per_insert_block is not None:
+        settings["max_partitions_per_insert_block"] = args.max_partitions_per_insert_block
+    client.execute(sql, data, columnar=True, settings=settings)
+    client.disconnect()
+    return count
+
+
+def load_scale(args, scale: float, tables=("ecom_offers", "raw_events"), truncate=TABLES) -> dict:
+    # truncate - что чистить при --truncate (по умолчанию все таблицы и MV стенда)
+    sz = sizes(scale, args.days)
+    client = make_client(args)
+    if args.truncate:
+        for t in truncate:
+            client.execute(f"TRUNCATE TABLE IF EXISTS {t}")
+
+    print(f"\n=== scale {scale}: {sz['offers']:,} offers, {sz['events']:,} events, "
+          f"{sz['vendors']:,} vendors, {sz['categories']:,} categories ===")
+    stats = {"scale": scale, **sz}
+    # Сначала каталог, потом события по его offer_id (их собирает offer_last_seen_mv)
+    for table, total in (("ecom_offers", sz["offers"]), ("raw_events", sz["events"])):
+        if table not in tables:
+            continue
+        chunks = (total + args.block_size - 1) // args.block_size
+        done = 0
+        t0 = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            for rows in pool.map(_insert_chunk, [args] * chunks, [table] * chunks, range(chunks), [sz] * chunks):
+                done += rows
+                print(f"  {table}: {done:>14,} / {total:,} rows  {done / (time.perf_counter() - t0):>12,.0f} rows/s",
+                      flush=True)
+        elapsed = time.perf_counter() - t0
+        stats[f"{table}_rows_per_sec"] = round(done / elapsed) if elapsed > 0 else 0
+    return stats
+
+
+def run_suite(args, scale: float, queries=None, prefix: str = "scale") -> dict:
+    # Тот же QUERIES-набор (или его часть) через test.py; медианы берём из его .jsonl
+    os.makedirs(args.out_dir, exist_ok=True)
+    base = os.path.join(args.out_dir, f"{prefix}_{scale:g}")
+    here = os.path.dirname(os.path.abspath(__file__))
+    cmd = [sys.executable, os.path.join(here, "test.py"), "--mode", "sequential",
+           "--iterations", str(args.iterations), "--output", base]
+    if queries:
+        cmd += ["--queries", *queries]
+    # test.py должен мерить тот же сервер, который мы только что загрузили
+    env = {**os.environ, "CLICKHOUSE_HOST": args.host, "CLICKHOUSE_PORT": str(args.port),
+           "CLICKHOUSE_DB": args.database, "CLICKHOUSE_USER": args.bench_user,
+           "CLICKHOUSE_PASSWORD": args.bench_password}
+    subprocess.run(cmd, check=True, env=env)
+    medians = {}
+    with open(base + ".jsonl", encoding="utf-8") as f:
+        for line in f:
+            rec = json.loads(line)
+            if rec.get("type") != "query":
+                continue
+            m = record_median(rec)
+            if math.isnan(m):
+                print(f"  {rec['key']}: no latencies in {base}.jsonl, left out of the summary")
+            else:
+                medians[rec["name"]] = m
+    return medians
+
+
+def plot(rows: list, path: str) -> None:
+    if plt is None:
+        print("matplotlib is not installed, skipping the plot")
+        return
+    queries = [k for k in rows[0] if k not in ("scale",)]
+    fig, ax = plt.subplots(figsize=(9, 6))
+    for q in queries:
+        ax.plot([r["scale"] for r in rows], [r[q] for r in rows], marker="o",
+                linestyle="-" if q.startswith("raw_") else "--", label=q)
+    ax.set_xscale("log")
+    ax.set_yscale("log")
+    ax.set_xlabel("scale factor")
+    ax.set_ylabel("median latency, s")
+    ax.legend(fontsize=8)
+    ax.grid(True, which="both", alpha=0.3)
+    fig.tight_layout()
+    fig.savefig(path, dpi=120)
+    print("Plot saved to:", path)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Deterministic synthetic data for ecom_offers/raw_events")
+    ap.add_argument("--scales", type=float, nargs="+", default=[1.0],
+                    help=f"scale factors, 1 = {BASE_OFFERS:,} offers and {BASE_EVENTS:,} events")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--days", type=int, default=30, help="raw_events time range in days")
+    ap.add_argument("--workers", type=int, default=4, help="parallel generator/insert processes")
+    ap.add_argument("--block-size", type=int, default=500_000, help="rows per INSERT block")
+    ap.add_argument("--truncate", action="store_true", help="truncate tables and MVs before loading each scale")
+    ap.add_argument("--max-partitions-per-insert-block", type=int, default=None,
+                    help="insert setting, 0 = unlimited (needed for the old per-vendor partitioned MVs)")
+    ap.add_argument("--bench", action="store_true", help="run the test.py QUERIES suite after each scale")
+    ap.add_argument("--iterations", type=int, default=10, help="--bench: iterations per query")
+    ap.add_argument("--out-dir", default="scaling", help="--bench: where to put per-scale results, csv and plot")
+    ap.add_argument("--host", default="localhost")
+    ap.add_argument("--port", type=int, default=9000)
+    ap.add_argument("--database", default="ecom")
+    ap.add_argument("--user", default="default")
+    ap.add_argument("--password", default="")
+    ap.add_argument("--bench-user", default="benchmark", help="--bench: user test.py measures as (same host/port/database)")
+    ap.add_argument("--bench-password", default="")
+    args = ap.parse_args()
+
+    if len(args.scales) > 1 and not args.truncate:
+        raise SystemExit("Several --scales need --truncate, otherwise scales pile up in the same tables")
+
+    load_stats = []
+    curves = []
+    for scale in args.scales:
+        load_stats.append(load_scale(args, scale))
+        if args.bench:
+            curves.append({"scale": scale, **run_suite(args, scale)})
+
+    print("\nIngest:")
+    for st in load_stats:
+        print(f"  scale {st['scale']:g}: ecom_offers {st['ecom_offers_rows_per_sec']:,} rows/s, "
+              f"raw_events {st['raw_events_rows_per_sec']:,} rows/s")
+
+    if curves:
+        path = os.path.join(args.out_dir, "scaling.csv")
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            w = csv.DictWriter(f, fieldnames=list(curves[0]))
+            w.writeheader()
+            w.writerows(curves)
+        print("Scaling results saved to:", path)
+        plot(curves, os.path.join(args.out_dir, "scaling.png"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+import argparse
+import datetime
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pyarrow.parquet as pq
+from clickhouse_driver import Client
+
+# Колонки parquet -> колонки таблицы (те же, что в INSERT ... SELECT FROM file() в clickhouse/init.sql)
+TABLE_COLUMNS = {
+    "ecom_offers": ["offer_id", "price", "seller_id", "category_id", "vendor"],
+    "raw_events": ["Hour", "DeviceTypeName", "ApplicationName", "OSName", "ProvinceName", "ContentUnitID"],
+}
+
+
+def make_client(args) -> Client:
+    return Client(host=args.host, port=args.port, database=args.database, user=args.user, password=args.password)
+
+
+def _insert_row_group(args, row_group: int) -> tuple:
+    # Каждый процесс сам читает свою row group из файла: между процессами ходят
+    # только номера row group, а не данные
+    client = make_client(args)
+    columns = TABLE_COLUMNS[args.table]
+    insert_columns = columns + (["snapshot_date"] if args.snapshot_date else [])
+    insert_sql = f"INSERT INTO {args.table} ({', '.join(insert_columns)}) VALUES"
+
+    pf = pq.ParquetFile(args.parquet)
+    rows = 0
+    t0 = time.perf_counter()
+    for batch in pf.iter_batches(batch_size=args.block_size, row_groups=[row_group], columns=columns):
+        data = [batch.column(i).to_pylist() for i in range(batch.num_columns)]
+        if args.snapshot_date:
+            data.append([args.snapshot_date] * batch.num_rows)
+        client.execute(insert_sql, data, columnar=True)
+        rows += batch.num_rows
+    client.disconnect()
+    return rows, time.perf_counter() - t0
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Parallel Parquet -> ClickHouse loader")
+    ap.add_argument("--parquet", required=True, help="Path to .parquet file, e.g. data/EcomOffer.parquet")
+    ap.add_argument("--table", required=True, choices=list(TABLE_COLUMNS))
+    ap.add_argument("--workers", type=int, default=4, help="parallel insert processes/connections")
+    ap.add_argument("--block-size", type=int, default=100_000, help="rows per INSERT block")
+    ap.add_argument("--snapshot-date", type=datetime.date.fromisoformat, default=None,
+                    help="ecom_offers: snapshot_date for the appended catalog snapshot (default: today() on server)")
+    ap.add_argument("--results", default=None, help="append a JSON line with the achieved rows/s to this file")
+    ap.add_argument("--host", default="localhost")
+    ap.add_argument("--port", type=int, default=9000)
+    ap.add_argument("--database", default="ecom")
+    ap.add_argument("--user", default="default")
+    ap.add_argument("--password", default="")
+    args = ap.parse_args()
+
+    if args.snapshot_date and args.table != "ecom_offers":
+        raise SystemExit("--snapshot-date is only valid for ecom_offers")
+
+    meta = pq.ParquetFile(args.parquet).metadata
+    missing = [c for c in TABLE_COLUMNS[args.table] if c not in meta.schema.names]
+    if missing:
+        raise SystemExit(f"Missing columns in parquet: {missing}")
+
+    print(f"Loading {args.parquet} -> {args.database}.{args.table}")
+    print(f"  rows={meta.num_rows}, row groups={meta.num_row_groups}, workers={args.workers}, block={args.block_size}")
+
+    done = 0
+    t0 = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = [pool.submit(_insert_row_group, args, rg) for rg in range(meta.num_row_groups)]
+        for f in as_completed(futures):
+            rows, _ = f.result()
+            done += rows
+            elapsed = time.perf_counter() - t0
+            print(f"  {done:>12,} / {meta.num_rows:,} rows  {done / elapsed:>12,.0f} rows/s", flush=True)
+    elapsed = time.perf_counter() - t0
+
+    rate = done / elapsed if elapsed > 0 else 0.0
+    print(f"\nLoaded {done:,} rows in {elapsed:.1f} s, {rate:,.0f} rows/s")
+
+    if args.results:
+        rec = {
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "parquet": args.parquet,
+            "table": args.table,
+            "rows": done,
+            "seconds": round(elapsed, 3),
+            "rows_per_sec": round(rate),
+            "workers": args.workers,
+            "block_size": args.block_size,
+        }
+        with open(args.results, "a", encoding="utf-8") as f:
+            f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,37 @@
 import argparse
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
 
 from config import normalize_partner
-from utils import split_category_path, print_table
+from utils import split_category_path, print_table, iter_parquet_batches, category_depths
 
-def main() -> None:
-    ap = argparse.ArgumentParser()
-    ap.add_argument("--parquet", required=True, help="Path to .parquet/.pq file")
-    args = ap.parse_args()
+REQUIRED = ["Partner_Name","Category_ID","Category_FullPathName","Offer_ID","Offer_Name","Offer_Type"]
+# --streaming: Offer_Name статистике не нужна, строковые колонки с повторами читаем словарями
+STREAM_COLUMNS = ["Partner_Name","Category_ID","Category_FullPathName","Offer_ID","Offer_Type"]
+DICTIONARY_COLUMNS = ["Partner_Name","Category_FullPathName","Offer_Type"]
+
+def _top10(counts: pd.DataFrame) -> list:
+    # один порядок для обоих режимов: по убыванию products_cnt, при равенстве по partner и category_id,
+    # причём числовые category_id сравниваются как числа (иначе "22" встаёт перед "5")
+    ids = pd.to_numeric(counts["category_id"], errors="coerce")
+    tie = ids if ids.notna().all() else counts["category_id"]
+    return (
+        counts.assign(_tie=tie)
+              .sort_values(["products_cnt","partner","_tie"], ascending=[False, True, True], kind="stable")
+              .head(10)
+              .drop(columns="_tie")
+              .to_dict(orient="records")
+    )
 
-    df = pd.read_parquet(args.parquet)
-    required = ["Partner_Name","Category_ID","Category_FullPathName","Offer_ID","Offer_Name","Offer_Type"]
-    missing = [c for c in required if c not in df.columns]
+def analyze_pandas(path: str) -> dict:
+    df = pd.read_parquet(path)
+    missing = [c for c in REQUIRED if c not in df.columns]
     if missing:
         raise SystemExit(f"Missing columns in parquet: {missing}")
 
@@ -24,29 +44,172 @@ def main() -> None:
     depths = df["Category_FullPathName"].map(lambda x: len(split_category_path(x)))
     max_depth = int(depths.max()) if len(depths) else 0
 
-    top10 = (
-        df.groupby(["partner","category_id"])["offer_id"]
-          .count()
-          .sort_values(ascending=False)
-          .head(10)
-          .reset_index(name="products_cnt")
-          .to_dict(orient="records")
-    )
+    top10 = _top10(df.groupby(["partner","category_id"])["offer_id"].count().reset_index(name="products_cnt"))
 
     partners_per_offer = df.groupby("offer_id")["partner"].nunique()
     offers_multi_partner = int((partners_per_offer > 1).sum())
 
     unique_types = int(df["offer_type"].nunique())
+    return {"unique_categories": unique_categories, "max_depth": max_depth, "offers_multi_partner": offers_multi_partner,
+            "unique_types": unique_types, "top10": top10}
+
+def _unique_pairs(offer: np.ndarray, partner: np.ndarray) -> tuple:
+    # различные (offer, partner), отсортированные по offer: 8 + 4 байта на пару
+    order = np.lexsort((partner, offer))
+    offer, partner = offer[order], partner[order]
+    keep = np.ones(len(offer), dtype=bool)
+    keep[1:] = (offer[1:] != offer[:-1]) | (partner[1:] != partner[:-1])
+    return offer[keep], partner[keep]
+
+def _offer_keys(offers: pa.Array) -> np.ndarray:
+    # целые id - сами себе ключ (без строк и без коллизий), остальное - 64-битный хэш значения
+    if pa.types.is_integer(offers.type):
+        return offers.to_numpy().astype(np.uint64)
+    return pd.util.hash_array(offers.to_numpy(zero_copy_only=False))
+
+def _distinct(col: pa.Array) -> pa.Array:
+    return col.dictionary if pa.types.is_dictionary(col.type) else pc.unique(col)
+
+def _scan_row_group(path: str, row_group: int, batch_size: int) -> dict:
+    """Частичная статистика одной row group: всё, что растёт с числом строк, уже свёрнуто"""
+    partners = {}       # нормализованный партнёр -> код внутри row group
+    normalized = {}     # сырое Partner_Name -> нормализованное
+    categories = {}     # (partner, Category_ID) -> [строк, строк с Offer_ID]
+    offer_runs, partner_runs = [], []
+    types = set()
+    max_depth = 0
+    for batch in iter_parquet_batches(path, STREAM_COLUMNS, batch_size, row_groups=[row_group],
+                                      read_dictionary=DICTIONARY_COLUMNS):
+        # партнёры: нормализуем только словарь батча, строки получают коды через его индексы
+        pcol = batch.column("Partner_Name")
+        if not pa.types.is_dictionary(pcol.type):
+            pcol = pc.dictionary_encode(pcol)
+        raw = pcol.dictionary.to_pylist() + [None]
+        for v in raw:
+            if v not in normalized:
+                # как в pandas-режиме: map по str-колонке, пропуск приходит в normalize_partner как NaN
+                normalized[v] = pd.Series([v], dtype="str").map(normalize_partner).iloc[0]
+        to_code = np.array([partners.setdefault(normalized[v], len(partners)) for v in raw], dtype=np.int32)
+        codes = to_code[pcol.indices.fill_null(len(raw) - 1).to_numpy()]
+
+        offers = batch.column("Offer_ID")
+        g = pa.table({"p": codes, "c": batch.column("Category_ID"), "o": offers}).group_by(["p", "c"]).aggregate(
+            [([], "count_all"), ("o", "count")])
+        names = list(partners)
+        for p, c, n, valid in zip(g["p"].to_pylist(), g["c"].to_pylist(), g["count_all"].to_pylist(), g["o_count"].to_pylist()):
+            acc = categories.setdefault((names[p], c), [0, 0])
+            acc[0] += n
+            acc[1] += valid
+
+        has_offer = offers.is_valid()
+        offer, partner = _unique_pairs(_offer_keys(offers.filter(has_offer)), codes[has_offer.to_numpy(zero_copy_only=False)])
+        offer_runs.append(offer)
+        partner_runs.append(partner)
+
+        types.update(x for x in _distinct(batch.column("Offer_Type")).to_pylist() if x is not None)
+        paths = _distinct(batch.column("Category_FullPathName"))
+        if len(paths):
+            max_depth = max(max_depth, int(category_depths(paths).max()))
+
+    offer, partner = _unique_pairs(np.concatenate(offer_runs or [np.empty(0, np.uint64)]),
+                                   np.concatenate(partner_runs or [np.empty(0, np.int32)]))
+    return {"categories": categories, "offers": offer, "partners": partner, "partner_names": list(partners),
+            "types": types, "max_depth": max_depth}
+
+class _PairRuns:
+    """Различные (offer, partner) по всему файлу: отсортированные прогоны, сливаются как в двоичном счётчике"""
+
+    def __init__(self) -> None:
+        self.codes = {}
+        self.runs = []
+
+    def add(self, offer: np.ndarray, partner: np.ndarray, partner_names: list) -> None:
+        # коды партнёров у каждой row group свои - переводим в общие
+        to_code = np.array([self.codes.setdefault(p, len(self.codes)) for p in partner_names], dtype=np.int32)
+        self.runs.append((offer, to_code[partner]))
+        while len(self.runs) > 1 and len(self.runs[-2][0]) <= len(self.runs[-1][0]):
+            (o2, p2), (o1, p1) = self.runs.pop(), self.runs.pop()
+            self.runs.append(_unique_pairs(np.concatenate([o1, o2]), np.concatenate([p1, p2])))
+
+    def offers_multi_partner(self) -> int:
+        if not self.runs:
+            return 0
+        offer, _ = _unique_pairs(np.concatenate([r[0] for r in self.runs]), np.concatenate([r[1] for r in self.runs]))
+        _, counts = np.unique(offer, return_counts=True)
+        return int((counts > 1).sum())
+
+def analyze_streaming(path: str, batch_size: int, workers: int) -> dict:
+    """Та же статистика, что analyze_pandas, но по row group в пуле потоков (Arrow и numpy отпускают GIL).
+
+    Память: батч на поток, счётчики по категориям и 12 байт на различную пару (offer, partner).
+    """
+    pf = pq.ParquetFile(path)
+    missing = [c for c in REQUIRED if c not in pf.schema_arrow.names]
+    if missing:
+        raise SystemExit(f"Missing columns in parquet: {missing}")
+
+    categories = {}
+    pairs = _PairRuns()
+    types = set()
+    max_depth = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # в очереди не больше 2 * workers row group: готовые частичные результаты сразу сливаются
+        pending = []
+        groups = iter(range(pf.num_row_groups))
+        while True:
+            while len(pending) < 2 * workers:
+                rg = next(groups, None)
+                if rg is None:
+                    break
+                pending.append(pool.submit(_scan_row_group, path, rg, batch_size))
+            if not pending:
+                break
+            part = pending.pop(0).result()
+            for key, (n, valid) in part["categories"].items():
+                acc = categories.setdefault(key, [0, 0])
+                acc[0] += n
+                acc[1] += valid
+            pairs.add(part["offers"], part["partners"], part["partner_names"])
+            types |= part["types"]
+            max_depth = max(max_depth, part["max_depth"])
+
+    # category_id в строку так же, как astype(str) после read_parquet: с pandas-метаданными файла
+    # (Int64 с пропусками остаётся "57", а не "57.0"), null остаётся пропуском
+    keys = list(categories)
+    field = pf.schema_arrow.field("Category_ID")
+    category_ids = pa.Table.from_arrays([pa.array([c for _, c in keys], type=field.type)],
+                                        schema=pa.schema([field], metadata=pf.schema_arrow.metadata))
+    category_ids = category_ids.to_pandas()["Category_ID"].astype(str)
+    cats = pd.DataFrame({"partner": [p for p, _ in keys], "category_id": category_ids,
+                         "products_cnt": [categories[k][1] for k in keys]})
+    unique_categories = int(cats[["partner","category_id"]].drop_duplicates().shape[0])
+    top10 = _top10(cats.groupby(["partner","category_id"], as_index=False)["products_cnt"].sum())
+    return {"unique_categories": unique_categories, "max_depth": max_depth,
+            "offers_multi_partner": pairs.offers_multi_partner(), "unique_types": len(types), "top10": top10}
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--parquet", required=True, help="Path to .parquet/.pq file")
+    ap.add_argument("--streaming", action="store_true",
+                    help="по батчам и row group в нескольких потоках, без загрузки файла в pandas")
+    ap.add_argument("--read-batch", type=int, default=1_000_000, help="--streaming: строк parquet за раз на поток")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="--streaming: потоков по row group")
+    args = ap.parse_args()
+
+    if args.streaming:
+        st = analyze_streaming(args.parquet, args.read_batch, args.workers)
+    else:
+        st = analyze_pandas(args.parquet)
 
     print("1.1) Анализ исходных данных")
-    print("Уникальных категорий (partner+category_id):", unique_categories)
-    print("Максимальная глубина вложенности категорий:", max_depth)
-    print("Offer_ID у нескольких партнеров:", offers_multi_partner)
-    print("Уникальных типов товаров (Offer_Type):", unique_types)
+    print("Уникальных категорий (partner+category_id):", st["unique_categories"])
+    print("Максимальная глубина вложенности категорий:", st["max_depth"])
+    print("Offer_ID у нескольких партнеров:", st["offers_multi_partner"])
+    print("Уникальных типов товаров (Offer_Type):", st["unique_types"])
 
     print_table(
         "Топ-10 категорий по количеству товаров",
-        top10,
+        st["top10"],
         [("partner","partner"),("category_id","category_id"),("products_cnt","products_cnt")]
     )
 
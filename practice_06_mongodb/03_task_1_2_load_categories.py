@@ -1,25 +1,78 @@
 import argparse
-import pandas as pd
-from pymongo import MongoClient, ReplaceOne
-from pymongo.errors import BulkWriteError
-
-from config import Config, normalize_partner
-from utils import split_category_path, path_slash, parent_path_slash, utc_now_naive, print_table, print_json
-
-def _flush(col, ops):
-    try:
-        col.bulk_write(ops, ordered=False)
-    except BulkWriteError as e:
-        we = e.details.get("writeErrors", [])
-        print("BulkWriteError:", len(we), "errors")
-        if we:
-            print("First error:", we[0].get("errmsg"))
-        raise
+import os
+from collections import Counter, defaultdict
+
+from pymongo import DeleteOne, MongoClient, ReplaceOne
+
+from bulk_pipeline import BulkPipeline, Progress
+from category_trie import CategoryTrie
+from config import Config
+from utils import path_slash, parent_path_slash, utc_now_naive, print_table, print_json, count_categories, category_nodes, content_hash
+
+def _tree_metadata(nodes: list) -> dict:
+    """nodes: [(doc_id, partner, path_array, total_products)] -> {doc_id: поля дерева}.
+
+    Дерево строится по path_array внутри партнёра: дети - категории с parent_path == path,
+    предки - существующие категории на префиксах пути. lft/rgt - nested set по обходу в глубину
+    дерева путей, поддерево X - это {partner, lft: {$gte: X.lft}, rgt: {$lte: X.rgt}}. Нумерация своя у каждого
+    партнёра: изменение дерева одного партнёра не сдвигает lft/rgt (а с ними content_hash) у остальных.
+    """
+    by_path = defaultdict(list)
+    child_count = Counter()
+    subtree = Counter()
+    children = defaultdict(set)
+    for doc_id, partner, parts, total in nodes:
+        parts = tuple(parts)
+        by_path[(partner, parts)].append(doc_id)
+        if len(parts) > 1:
+            child_count[(partner, parts[:-1])] += 1
+        for i in range(1, len(parts) + 1):
+            subtree[(partner, parts[:i])] += total
+            children[(partner, parts[:i - 1])].add(parts[i - 1])
+
+    # Обход в глубину по всем префиксам (включая пути без своей категории), детей - по имени
+    ordinals = {}
+    for partner in sorted({p for p, _ in children}):
+        n = 0
+        stack = [((), False)]
+        while stack:
+            parts, done = stack.pop()
+            if done:
+                ordinals[(partner, parts)] = (ordinals[(partner, parts)], n)
+                n += 1
+                continue
+            ordinals[(partner, parts)] = n
+            n += 1
+            stack.append((parts, True))
+            for name in sorted(children.get((partner, parts), ()), reverse=True):
+                stack.append((parts + (name,), False))
+
+    out = {}
+    for doc_id, partner, parts, total in nodes:
+        parts = tuple(parts)
+        key = (partner, parts)
+        lft, rgt = ordinals[key] if parts else (None, None)
+        out[doc_id] = {
+            "is_leaf": child_count[key] == 0,
+            "child_count": child_count[key],
+            "ancestors": [a for i in range(1, len(parts)) for a in by_path.get((partner, parts[:i]), [])],
+            "lft": lft,
+            "rgt": rgt,
+            "subtree_products": subtree[key] if parts else total,
+        }
+    return out
 
 def main() -> None:
     ap = argparse.ArgumentParser()
     ap.add_argument("--parquet", required=True)
     ap.add_argument("--batch", type=int, default=2000)
+    ap.add_argument("--read-batch", type=int, default=100_000, help="строк parquet за раз (ограничивает память)")
+    ap.add_argument("--writers", type=int, default=4, help="потоков bulk_write")
+    ap.add_argument("--incremental", action="store_true",
+                    help="писать только новые и изменившиеся категории (по content_hash) и удалять пропавшие; "
+                         "новая или удалённая категория сдвигает lft/rgt и перезаписывает категории своего партнёра")
+    ap.add_argument("--progress-every", type=float, default=2.0, help="секунд между строками docs/s, 0 = выкл.")
+    ap.add_argument("--trie-snapshot", default=None, help="записать снапшот дерева категорий для category_nav.py (.npz)")
     args = ap.parse_args()
 
     cfg = Config()
@@ -27,35 +80,57 @@ def main() -> None:
     db = client[cfg.db_name]
     col = db["categories"]
 
-    df = pd.read_parquet(args.parquet)
-    df["partner"] = df["Partner_Name"].map(normalize_partner)
-    df["category_id"] = df["Category_ID"].astype(str)
+    cats = count_categories(args.parquet, args.read_batch)
 
-    cnt = df.groupby(["partner","category_id"]).size().reset_index(name="total_products")
-    rep = df.groupby(["partner","category_id"])["Category_FullPathName"].first().reset_index()
-    cats = cnt.merge(rep, on=["partner","category_id"], how="left")
+    # категорий немного, хэши всех уже записанных помещаются в память
+    existing = {d["_id"]: d.get("content_hash") for d in col.find({}, {"content_hash": 1})} if args.incremental else {}
+    stats = {"new": 0, "changed": 0, "unchanged": 0, "deleted": 0}
+
+    nodes = category_nodes(cats)
+    tree = _tree_metadata(nodes)
+    if args.trie_snapshot:
+        CategoryTrie.build(nodes, source=f"parquet:{os.path.basename(args.parquet)}").save(args.trie_snapshot)
+        print("Снапшот дерева категорий:", args.trie_snapshot)
 
     now = utc_now_naive()
-    ops = []
-    for row in cats.itertuples(index=False):
-        parts = split_category_path(row.Category_FullPathName)
-        doc_id = f"{row.partner}_{row.category_id}"
-        doc = {
-            "_id": doc_id,
-            "partner": row.partner,
-            "category_id": row.category_id,
-            "name": parts[-1] if parts else None,
-            "path": path_slash(parts),
-            "path_array": parts,
-            "level": int(len(parts)),
-            "parent_path": parent_path_slash(parts),
-            "metadata": {"total_products": int(row.total_products), "last_updated": now},
-        }
-        ops.append(ReplaceOne({"_id": doc_id}, doc, upsert=True))
-        if len(ops) >= args.batch:
-            _flush(col, ops); ops = []
-    if ops:
-        _flush(col, ops)
+    pipe = BulkPipeline(col, batch=args.batch, writers=args.writers)
+    with Progress(lambda: pipe.written, args.progress_every):
+        for (doc_id, partner, parts, total_products), category_id in zip(nodes, (c for _, c in cats)):
+            t = tree[doc_id]
+            doc = {
+                "_id": doc_id,
+                "partner": partner,
+                "category_id": category_id,
+                "name": parts[-1] if parts else None,
+                "path": path_slash(parts),
+                "path_array": parts,
+                "level": int(len(parts)),
+                "parent_path": parent_path_slash(parts),
+                "is_leaf": t["is_leaf"],
+                "child_count": t["child_count"],
+                "ancestors": t["ancestors"],
+                "lft": t["lft"],
+                "rgt": t["rgt"],
+                "metadata": {"total_products": total_products, "subtree_products": t["subtree_products"]},
+            }
+            # last_updated в хэш не входит, иначе каждая категория "меняется" при каждом запуске
+            h = content_hash(doc)
+            if existing.get(doc_id) == h:
+                stats["unchanged"] += 1
+                continue
+            stats["changed" if doc_id in existing else "new"] += 1
+            doc["metadata"]["last_updated"] = now
+            doc["content_hash"] = h
+            pipe.add(doc_id, ReplaceOne({"_id": doc_id}, doc, upsert=True))
+        if args.incremental and cats:
+            current = {f"{partner}_{category_id}" for partner, category_id in cats}
+            for doc_id in existing.keys() - current:
+                pipe.add(doc_id, DeleteOne({"_id": doc_id}))
+                stats["deleted"] += 1
+        pipe.close()
+    if args.incremental:
+        print(f"categories: new {stats['new']:,}, changed {stats['changed']:,}, "
+              f"unchanged {stats['unchanged']:,}, deleted {stats['deleted']:,}")
 
     total = col.count_documents({})
     dist = list(col.aggregate([{"$group": {"_id": "$level", "cnt": {"$sum": 1}}}, {"$sort": {"_id": 1}}]))
@@ -79,11 +154,11 @@ def main() -> None:
         print("  ", x)
 
     if sample_root:
-        print_json("Пример документа (level=1)", {k: sample_root[0].get(k) for k in ["_id","partner","category_id","name","path","path_array","level","parent_path","metadata"]})
+        print_json("Пример документа (level=1)", {k: sample_root[0].get(k) for k in ["_id","partner","category_id","name","path","path_array","level","parent_path","is_leaf","child_count","ancestors","lft","rgt","metadata"]})
     if sample_lvl4:
-        print_json("Пример документа (level=4)", {k: sample_lvl4[0].get(k) for k in ["_id","partner","category_id","name","path","path_array","level","parent_path","metadata"]})
+        print_json("Пример документа (level=4)", {k: sample_lvl4[0].get(k) for k in ["_id","partner","category_id","name","path","path_array","level","parent_path","is_leaf","child_count","ancestors","lft","rgt","metadata"]})
     if sample_deep:
-        print_json("Пример документа (макс. глубина)", {k: sample_deep[0].get(k) for k in ["_id","partner","category_id","name","path","path_array","level","parent_path","metadata"]})
+        print_json("Пример документа (макс. глубина)", {k: sample_deep[0].get(k) for k in ["_id","partner","category_id","name","path","path_array","level","parent_path","is_leaf","child_count","ancestors","lft","rgt","metadata"]})
 
 if __name__ == "__main__":
     main()
@@ -1,25 +1,147 @@
 import argparse
+import multiprocessing as mp
+import time
+
 import pandas as pd
-from pymongo import MongoClient, UpdateOne
-from pymongo.errors import BulkWriteError
+from pymongo import DeleteOne, MongoClient, UpdateOne
 
+from breadcrumb_rollup import ROLLUP, breadcrumb_keys, refresh_rollup
+from bulk_pipeline import BulkPipeline, Progress
 from config import Config, normalize_partner
-from utils import split_category_path, path_slash, utc_now_naive, print_table, print_json
+from utils import split_category_path, path_slash, utc_now_naive, print_table, print_json, iter_parquet_batches, map_unique, SeenKeys, key_hash, content_hash
+
+COLUMNS = ["Partner_Name", "Offer_ID", "Offer_Name", "Offer_Type", "Category_ID", "Category_FullPathName"]
+
+def _category_info(full_path_name) -> dict:
+    # Общий для всех товаров категории: breadcrumbs не копируются, в BSON они всё равно сериализуются заново
+    parts = split_category_path(full_path_name)
+    return {
+        "name": parts[-1] if parts else None,
+        "full_path": path_slash(parts),
+        "breadcrumbs": [{"level": i+1, "name": name} for i, name in enumerate(parts)],
+    }
+
+def _stored(col, ids: list, chunk: int = 10_000) -> dict:
+    # content_hash уже записанных документов (чтение пары полей по _id дешевле, чем перезапись товара)
+    # и их крошки: если товар изменится или пропадёт, эти ключи breadcrumb_rollup надо пересчитать
+    out = {}
+    for i in range(0, len(ids), chunk):
+        for d in col.find({"_id": {"$in": ids[i:i + chunk]}},
+                          {"content_hash": 1, "partner": 1, "category.breadcrumbs.name": 1}):
+            out[d["_id"]] = d
+    return out
+
+def _vanished(col, seen: SeenKeys, producer: int, producers: int, chunk: int = 100_000):
+    # _id из коллекции (своей доли), которых не было в снимке: идём по индексу _id, документы не читаем
+    cursor = col.find({}, {"_id": 1}).hint([("_id", 1)]).batch_size(chunk)
+    while True:
+        ids = pd.Series([d["_id"] for _, d in zip(range(chunk), cursor)], dtype=object)
+        if ids.empty:
+            return
+        mask = ~seen.contains(ids)
+        if producers > 1:
+            mask &= key_hash(ids) % producers == producer
+        yield from ids[mask].tolist()
+
+def _load(args, now, producer: int = 0, producers: int = 1, progress=None, rows=None, touched=None) -> int:
+    # Один производитель: читает parquet, берёт свою долю ключей (hash % producers == producer) и строит операции.
+    # Один и тот же _id всегда попадает в один процесс, поэтому SeenKeys на процесс достаточно
+    cfg = Config()
+    client = MongoClient(cfg.mongo_uri, maxPoolSize=max(100, args.writers))
+    col = client[cfg.db_name]["products"]
 
-def _flush(col, ops):
+    # инкрементальному режиму нужен полный набор ключей снимка, чтобы найти исчезнувшие товары
+    seen = SeenKeys() if args.dedup == "memory" or args.incremental else None
+    stats = {"new": 0, "changed": 0, "unchanged": 0, "deleted": 0}
+    keys_touched = set()
+    partner_memo, path_memo = {}, {}
+    pipe = BulkPipeline(col, batch=args.batch, writers=args.writers, queue_size=args.queue,
+                        range_batches=args.range_batches, progress=progress)
+    rows_read = 0
     try:
-        col.bulk_write(ops, ordered=False)
-    except BulkWriteError as e:
-        we = e.details.get("writeErrors", [])
-        print("BulkWriteError:", len(we), "errors")
-        if we:
-            print("First error:", we[0].get("errmsg"))
-        raise
+        for batch in iter_parquet_batches(args.parquet, COLUMNS, args.read_batch, string_ids=["Offer_ID", "Category_ID"]):
+            rows_read += batch.num_rows
+            df = batch.to_pandas()
+            # Партнёров и путей категорий единицы тысяч на миллионы строк: разбираем каждое
+            # уникальное значение один раз (memo живёт весь файл), остальное - операции над колонками
+            df["partner"] = map_unique(df["Partner_Name"], normalize_partner, partner_memo)
+            df["offer_id"] = df["Offer_ID"].astype(str)
+
+            keys = df["partner"] + "_" + df["offer_id"]
+            if producers > 1:
+                mine = key_hash(keys) % producers == producer
+                df, keys = df[mine], keys[mine]
+            first = seen.first_seen(keys) if seen is not None else ~keys.duplicated().to_numpy()
+            df, keys = df[first], keys[first]
+
+            categories = map_unique(df["Category_FullPathName"], _category_info, path_memo)
+            ids = keys.tolist()
+            existing = _stored(col, ids) if args.incremental else {}
+            for doc_id, partner, offer_id, name, type_, category_id, category in zip(
+                    ids, df["partner"].tolist(), df["offer_id"].tolist(),
+                    df["Offer_Name"].astype(str).tolist(), df["Offer_Type"].astype(str).tolist(),
+                    df["Category_ID"].astype(str).tolist(), categories):
+                doc_set = {
+                    "partner": partner,
+                    "offer_id": offer_id,
+                    "name": name,
+                    "type": type_,
+                    "category": {"id": category_id, **category},
+                }
+                h = content_hash(doc_set)
+                old = existing.get(doc_id)
+                if old is not None and old.get("content_hash") == h:
+                    stats["unchanged"] += 1
+                    continue
+                stats["changed" if old is not None else "new"] += 1
+                if args.incremental:
+                    keys_touched |= breadcrumb_keys(doc_set)
+                    if old is not None:
+                        keys_touched |= breadcrumb_keys(old)
+                doc_set["content_hash"] = h
+                doc_set["updated_at"] = now
+                pipe.add(doc_id, UpdateOne({"_id": doc_id}, {"$set": doc_set, "$setOnInsert": {"created_at": now}}, upsert=True))
+
+        if args.incremental and len(seen):
+            # крошки удаляемых товаров читаем до удаления, пока писатели их не стёрли
+            gone = list(_vanished(col, seen, producer, producers))
+            for old in _stored(col, gone).values():
+                keys_touched |= breadcrumb_keys(old)
+            for doc_id in gone:
+                pipe.add(doc_id, DeleteOne({"_id": doc_id}))
+                stats["deleted"] += 1
+    finally:
+        pipe.close()
+        client.close()
+    if args.incremental:
+        print(f"producer {producer}: new {stats['new']:,}, changed {stats['changed']:,}, "
+              f"unchanged {stats['unchanged']:,}, deleted {stats['deleted']:,}", flush=True)
+        if touched is not None:
+            touched.extend(keys_touched)
+    # файл целиком читает каждый производитель, строки считаем один раз
+    if rows is not None and producer == 0:
+        with rows.get_lock():
+            rows.value += rows_read
+    return rows_read
 
 def main() -> None:
     ap = argparse.ArgumentParser()
     ap.add_argument("--parquet", required=True)
     ap.add_argument("--batch", type=int, default=2000)
+    ap.add_argument("--read-batch", type=int, default=100_000, help="строк parquet за раз (ограничивает память)")
+    ap.add_argument("--dedup", choices=["memory", "server"], default="memory",
+                    help="memory: хэши уже загруженных _id (8 байт на товар), первая строка выигрывает; "
+                         "server: без состояния, повтор из другого батча перезапишет документ upsert-ом")
+    ap.add_argument("--producers", type=int, default=1, help="процессов, строящих документы (каждый - своя доля _id)")
+    ap.add_argument("--writers", type=int, default=4, help="потоков bulk_write на производителя")
+    ap.add_argument("--queue", type=int, default=0, help="батчей в очереди к писателям (0 = 2 * writers)")
+    ap.add_argument("--range-batches", type=int, default=1,
+                    help="сортировать по _id окно из стольких батчей и резать на диапазоны (для шардов по _id)")
+    ap.add_argument("--incremental", action="store_true",
+                    help="писать только новые и изменившиеся товары (по content_hash) и удалять пропавшие из снимка")
+    ap.add_argument("--progress-every", type=float, default=2.0, help="секунд между строками docs/s, 0 = выкл.")
+    ap.add_argument("--skip-rollup", action="store_true",
+                    help=f"не обновлять {ROLLUP} (витрину крошек для 08) после загрузки")
     args = ap.parse_args()
 
     cfg = Config()
@@ -27,39 +149,36 @@ def main() -> None:
     db = client[cfg.db_name]
     col = db["products"]
 
-    df = pd.read_parquet(args.parquet)
-    df["partner"] = df["Partner_Name"].map(normalize_partner)
-    df["offer_id"] = df["Offer_ID"].astype(str)
-    df["offer_name"] = df["Offer_Name"].astype(str)
-    df["offer_type"] = df["Offer_Type"].astype(str)
-    df["category_id"] = df["Category_ID"].astype(str)
-
-    df = df.drop_duplicates(subset=["partner","offer_id"], keep="first")
-
     now = utc_now_naive()
-    ops = []
-    for row in df.itertuples(index=False):
-        parts = split_category_path(row.Category_FullPathName)
-        doc_id = f"{row.partner}_{row.offer_id}"
-        breadcrumbs = [{"level": i+1, "name": name} for i, name in enumerate(parts)]
-        doc_set = {
-            "partner": row.partner,
-            "offer_id": row.offer_id,
-            "name": row.offer_name,
-            "type": row.offer_type,
-            "category": {
-                "id": row.category_id,
-                "name": parts[-1] if parts else None,
-                "full_path": path_slash(parts),
-                "breadcrumbs": breadcrumbs,
-            },
-            "updated_at": now,
-        }
-        ops.append(UpdateOne({"_id": doc_id}, {"$set": doc_set, "$setOnInsert": {"created_at": now}}, upsert=True))
-        if len(ops) >= args.batch:
-            _flush(col, ops); ops = []
-    if ops:
-        _flush(col, ops)
+    progress = mp.Value("q", 0)
+    rows = mp.Value("q", 0)
+    manager = mp.Manager() if args.producers > 1 else None
+    # (partner, name) крошек, которых коснулась инкрементальная загрузка; после полной - вся витрина
+    touched = manager.list() if manager is not None else []
+    with Progress(lambda: progress.value, args.progress_every) as pr:
+        if args.producers <= 1:
+            _load(args, now, progress=progress, rows=rows, touched=touched)
+        else:
+            procs = [mp.Process(target=_load, args=(args, now, p, args.producers, progress, rows, touched))
+                     for p in range(args.producers)]
+            for p in procs:
+                p.start()
+            for p in procs:
+                p.join()
+            failed = [p.exitcode for p in procs if p.exitcode != 0]
+            if failed:
+                raise SystemExit(f"{len(failed)} producer process(es) failed")
+    rows_read = rows.value
+    print(f"Записано операций: {progress.value:,} за {pr.elapsed:.1f} s, "
+          f"{progress.value / pr.elapsed if pr.elapsed > 0 else 0:,.0f} docs/s")
+
+    if not args.skip_rollup:
+        t0 = time.perf_counter()
+        st = refresh_rollup(col, db[ROLLUP], list(touched) if args.incremental else None)
+        print(f"{ROLLUP}: {'пересчитано' if args.incremental else 'пересобрано'} {st['keys']:,} ключей, "
+              f"удалено {st['removed']:,} за {time.perf_counter() - t0:.1f} s")
+    if manager is not None:
+        manager.shutdown()
 
     total = col.count_documents({})
 
@@ -80,6 +199,7 @@ def main() -> None:
     sample_id = sample[0]["_id"] if sample else None
 
     print("Загрузка products")
+    print("Прочитано строк parquet:", rows_read)
     print("Общее количество товаров:", total)
     print_table("Топ-5 типов товаров", top_types_rows, [("type","type"),("cnt","cnt")])
     print_table("Распределение товаров по партнерам", by_partner_rows, [("partner","partner"),("cnt","cnt")])
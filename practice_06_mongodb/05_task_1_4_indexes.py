@@ -1,5 +1,6 @@
 from pymongo import MongoClient
 from config import Config
+from index_sets import BASELINE
 from utils import print_json
 
 def main() -> None:
@@ -10,15 +11,9 @@ def main() -> None:
     categories = db["categories"]
     products = db["products"]
 
-    categories.create_index([("path", "text")], name="idx_text_path")
-    categories.create_index([("path_array", 1)], name="idx_path_array")
-    categories.create_index([("partner", 1), ("level", 1)], name="idx_partner_level")
-    categories.create_index([("metadata.total_products", -1)], name="idx_total_products")
-
-    products.create_index([("partner", 1), ("category.id", 1)], name="idx_partner_categoryid")
-    products.create_index([("category.breadcrumbs.name", 1)], name="idx_breadcrumbs_name")
-    products.create_index([("type", 1), ("partner", 1)], name="idx_type_partner")
-    products.create_index([("offer_id", 1)], name="idx_offer_id")
+    # набор индексов из index_sets.py; альтернативные наборы сравнивает bench_queries.py
+    for name, models in BASELINE.items():
+        db[name].create_indexes(models)
 
     idx_cat = list(categories.list_indexes())
     idx_prod = list(products.list_indexes())
@@ -1,12 +1,23 @@
+import argparse
+import pyarrow as pa
 from pymongo import MongoClient
 from config import Config
-from utils import explain_agg_time_ms, print_table, print_json
+from breadcrumb_rollup import ROLLUP, refresh_rollup, level_name_pipeline, level_reports_pipeline
+from utils import explain_agg_time_ms, print_table, print_json, ResultReader
 
 def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--arrow", action="store_true", help="декодировать результаты в Arrow (pymongoarrow, если установлен)")
+    ap.add_argument("--export", default=None, help="папка: каждый результат ещё и в <name>.parquet")
+    ap.add_argument("--rebuild-rollup", action="store_true", help=f"пересобрать {ROLLUP} из products перед отчётами")
+    args = ap.parse_args()
+    reader = ResultReader(args.arrow, args.export)
+
     cfg = Config()
     client = MongoClient(cfg.mongo_uri)
     db = client[cfg.db_name]
     col = db["products"]
+    rollup = db[ROLLUP]
 
     print("3.1) Агрегации по products")
 
@@ -20,9 +31,13 @@ def main() -> None:
         {"$sort": {"count": -1}},
         {"$limit": 10},
     ]
-    res1 = list(col.aggregate(pipeline1))
+    rows1 = reader.aggregate(col, pipeline1, {
+        "category_id": ("$_id", pa.string()),
+        "name": ("$category_name", pa.string()),
+        "full_path": ("$full_path", pa.string()),
+        "count": ("$count", pa.int64()),
+    }, "agg1_top10_categories")
     time1 = explain_agg_time_ms(db, "products", pipeline1)
-    rows1 = [{"category_id": r["_id"], "name": r["category_name"], "full_path": r["full_path"], "count": r["count"]} for r in res1]
 
     print("\n[Агрегация 1] Топ-10 категорий по количеству товаров")
     print_json("Pipeline", pipeline1)
@@ -31,39 +46,30 @@ def main() -> None:
     if rows1:
         print("Самая большая категория:", rows1[0]["name"], "| category_id=", rows1[0]["category_id"], "| count=", rows1[0]["count"])
 
-    pipeline2 = [
-        {"$unwind": "$category.breadcrumbs"},
-        {"$group": {"_id": {"level": "$category.breadcrumbs.level", "name": "$category.breadcrumbs.name"}, "cnt": {"$sum": 1}}},
-        {"$sort": {"_id.level": 1, "cnt": -1}},
-        {"$limit": 30},
-    ]
-    res2 = list(col.aggregate(pipeline2))
-    rows2 = [{"level": r["_id"]["level"], "name": r["_id"]["name"], "cnt": r["cnt"]} for r in res2]
+    # Агрегации 2-3 читают витрину breadcrumb_rollup (её обновляет 04), а не разворачивают breadcrumbs всех товаров
+    if args.rebuild_rollup or rollup.estimated_document_count() == 0:
+        st = refresh_rollup(col, rollup)
+        print(f"\n{ROLLUP} пересобрана: {st['keys']} ключей (level, name, partner)")
+
+    pipeline2 = level_name_pipeline(30)
+    rows2 = reader.aggregate(rollup, pipeline2, {
+        "level": ("$_id.level", pa.int64()),
+        "name": ("$_id.name", pa.string()),
+        "cnt": ("$cnt", pa.int64()),
+    }, "agg2_breadcrumbs_by_level")
 
     print("\n[Агрегация 2] Иерархическая статистика по уровням (30 строк)")
-    print_json("Pipeline", pipeline2)
+    print_json(f"Pipeline ({ROLLUP})", pipeline2)
     print_table("Таблица (30 строк)", rows2, [("level","level"),("name","name"),("cnt","cnt")])
 
-    level_totals = list(col.aggregate([
-        {"$unwind": "$category.breadcrumbs"},
-        {"$group": {"_id": "$category.breadcrumbs.level", "cnt": {"$sum": 1}}},
-        {"$sort": {"cnt": -1}},
-    ]))
+    levels = (1, 2, 3)
+    reports = next(rollup.aggregate(level_reports_pipeline(levels, 3)))
+    level_totals = reports["level_totals"]
     if level_totals:
         print("\nУровень с максимальным количеством товаров:", level_totals[0]["_id"], "(cnt=", level_totals[0]["cnt"], ")")
 
-    def top3(level: int):
-        pipe = [
-            {"$unwind": "$category.breadcrumbs"},
-            {"$match": {"category.breadcrumbs.level": level}},
-            {"$group": {"_id": "$category.breadcrumbs.name", "cnt": {"$sum": 1}}},
-            {"$sort": {"cnt": -1}},
-            {"$limit": 3},
-        ]
-        return list(col.aggregate(pipe))
-
-    for lvl in (1,2,3):
-        t = top3(lvl)
+    for lvl in levels:
+        t = reports[f"top_level_{lvl}"]
         if t:
             txt = ", ".join([f"{x['_id']} ({x['cnt']})" for x in t])
             print(f"Топ-3 категорий на уровне {lvl}: {txt}")
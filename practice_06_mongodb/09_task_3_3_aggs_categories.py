@@ -1,8 +1,16 @@
+import argparse
+import pyarrow as pa
 from pymongo import MongoClient
 from config import Config
-from utils import print_table, print_json
+from utils import print_table, print_json, ResultReader
 
 def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--arrow", action="store_true", help="декодировать результаты в Arrow (pymongoarrow, если установлен)")
+    ap.add_argument("--export", default=None, help="папка: каждый результат ещё и в <name>.parquet")
+    args = ap.parse_args()
+    reader = ResultReader(args.arrow, args.export)
+
     cfg = Config()
     client = MongoClient(cfg.mongo_uri)
     db = client[cfg.db_name]
@@ -16,22 +24,32 @@ def main() -> None:
                     "products_sum": {"$sum": "$metadata.total_products"}}},
         {"$sort": {"_id.partner": 1, "_id.level": 1}},
     ]
-    resA = list(col.aggregate(pipelineA))
-    rowsA = [{"partner": r["_id"]["partner"], "level": r["_id"]["level"], "categories_cnt": r["categories_cnt"], "products_sum": r["products_sum"]} for r in resA]
+    rowsA = reader.aggregate(col, pipelineA, {
+        "partner": ("$_id.partner", pa.string()),
+        "level": ("$_id.level", pa.int64()),
+        "categories_cnt": ("$categories_cnt", pa.int64()),
+        "products_sum": ("$products_sum", pa.int64()),
+    }, "aggA_levels_by_partner")
 
     print("\n[Агрегация A] распределение категорий по уровням и партнерам")
     print_json("Pipeline", pipelineA)
     print_table("Результат", rowsA, [("partner","partner"),("level","level"),("categories_cnt","categories_cnt"),("products_sum","products_sum")])
 
+    # is_leaf считает 03 при загрузке, внутри партнёра: лист - категория, у которой у того же партнёра нет
+    # дочерних путей. Раньше здесь был $lookup categories на саму себя по parent_path среди всех партнёров,
+    # и категория, чей путь у другого партнёра имеет детей, листом не считалась (сравнение - bench_category_tree.py)
     pipelineB = [
-        {"$lookup": {"from": "categories", "localField": "path", "foreignField": "parent_path", "as": "children"}},
-        {"$match": {"children": {"$size": 0}}},
-        {"$project": {"partner": 1, "name": 1, "path": 1, "level": 1, "metadata.total_products": 1}},
+        {"$match": {"is_leaf": True}},
         {"$sort": {"metadata.total_products": -1}},
         {"$limit": 10},
+        {"$project": {"partner": 1, "name": 1, "path": 1, "level": 1, "metadata.total_products": 1}},
     ]
-    resB = list(col.aggregate(pipelineB))
-    rowsB = [{"partner": r.get("partner"), "level": r.get("level"), "path": r.get("path"), "total_products": r.get("metadata", {}).get("total_products")} for r in resB]
+    rowsB = reader.aggregate(col, pipelineB, {
+        "partner": ("$partner", pa.string()),
+        "level": ("$level", pa.int64()),
+        "path": ("$path", pa.string()),
+        "total_products": ("$metadata.total_products", pa.int64()),
+    }, "aggB_top10_leaves")
 
     print("\n[Агрегация B] категории-листья: топ-10 по total_products")
     print_json("Pipeline", pipelineB)
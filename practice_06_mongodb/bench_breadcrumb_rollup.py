@@ -0,0 +1,103 @@
+import argparse
+import time
+
+from pymongo import MongoClient
+
+from breadcrumb_rollup import breadcrumb_keys, level_name_pipeline, level_reports_pipeline, refresh_rollup
+from config import Config
+from utils import print_table
+
+# Отчёты 08 по хлебным крошкам: полный проход по товарам ($unwind, как было в 08) против чтения витрины.
+# Для каждого размера из products собирается выборка bench_products (если товаров меньше - копии с другими _id)
+
+LEVELS = (1, 2, 3)
+
+def scan_reports(products) -> dict:
+    # Прежние пять запросов 08: каждый заново разворачивает breadcrumbs всех товаров
+    unwind = [{"$unwind": "$category.breadcrumbs"}]
+    out = {"by_level_name": list(products.aggregate(unwind + [
+        {"$group": {"_id": {"level": "$category.breadcrumbs.level", "name": "$category.breadcrumbs.name"}, "cnt": {"$sum": 1}}},
+        {"$sort": {"_id.level": 1, "cnt": -1, "_id.name": 1}},
+        {"$limit": 30},
+    ]))}
+    out["level_totals"] = list(products.aggregate(unwind + [
+        {"$group": {"_id": "$category.breadcrumbs.level", "cnt": {"$sum": 1}}},
+        {"$sort": {"cnt": -1, "_id": 1}},
+    ]))
+    for level in LEVELS:
+        out[f"top_level_{level}"] = list(products.aggregate(unwind + [
+            {"$match": {"category.breadcrumbs.level": level}},
+            {"$group": {"_id": "$category.breadcrumbs.name", "cnt": {"$sum": 1}}},
+            {"$sort": {"cnt": -1, "_id": 1}},
+            {"$limit": 3},
+        ]))
+    return out
+
+def rollup_reports(rollup) -> dict:
+    out = {"by_level_name": list(rollup.aggregate(level_name_pipeline(30)))}
+    out.update(next(rollup.aggregate(level_reports_pipeline(LEVELS, 3))))
+    return out
+
+def make_sample(db, size: int, name: str) -> int:
+    total = db["products"].estimated_document_count()
+    if total == 0:
+        raise SystemExit("products пуста: сначала 04_task_1_3_load_products.py")
+    pipeline = []
+    # недостающие товары - копии тех же документов с _id "<_id>#k": категории те же, товаров больше
+    for k in range(1, -(-size // total)):
+        pipeline.append({"$unionWith": {"coll": "products", "pipeline": [
+            {"$set": {"_id": {"$concat": [{"$toString": "$_id"}, f"#{k}"]}}}]}})
+    pipeline += [{"$limit": size}, {"$out": name}]
+    db["products"].aggregate(pipeline, allowDiskUse=True)
+    db[name].create_index([("category.breadcrumbs.name", 1)], name="idx_breadcrumbs_name")
+    return db[name].estimated_document_count()
+
+def _timed(fn, repeat: int):
+    times, res = [], None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        res = fn()
+        times.append((time.perf_counter() - t0) * 1000)
+    times.sort()
+    return res, round(times[len(times) // 2], 2)
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000], help="товаров в выборке")
+    ap.add_argument("--repeat", type=int, default=5, help="прогонов каждого варианта (берём медиану)")
+    ap.add_argument("--keep", action="store_true", help="не удалять bench_products / bench_rollup")
+    args = ap.parse_args()
+
+    cfg = Config()
+    client = MongoClient(cfg.mongo_uri)
+    db = client[cfg.db_name]
+    products, rollup = db["bench_products"], db["bench_rollup"]
+
+    rows = []
+    for size in args.sizes:
+        rollup.drop()
+        n = make_sample(db, size, products.name)
+        scan, scan_ms = _timed(lambda: scan_reports(products), args.repeat)
+        t0 = time.perf_counter()
+        st = refresh_rollup(products, rollup)
+        build_ms = round((time.perf_counter() - t0) * 1000, 2)
+        lookup, lookup_ms = _timed(lambda: rollup_reports(rollup), args.repeat)
+        # инкремент после загрузки: пересчёт ключей одного изменившегося товара
+        one = breadcrumb_keys(products.find_one({}, {"partner": 1, "category.breadcrumbs.name": 1}) or {})
+        _, refresh_ms = _timed(lambda: refresh_rollup(products, rollup, one), args.repeat)
+        rows.append({"products": n, "rollup_keys": st["keys"], "scan_ms": scan_ms, "lookup_ms": lookup_ms,
+                     "speedup": round(scan_ms / lookup_ms, 1) if lookup_ms else None,
+                     "build_ms": build_ms, "refresh_one_ms": refresh_ms, "same_result": scan == lookup})
+        print(f"  {n:,} products: scan {scan_ms} ms, rollup {lookup_ms} ms", flush=True)
+
+    print_table("Отчёты 08 по крошкам: полный проход против витрины (медианы)", rows, [
+        ("products", "products"), ("rollup_keys", "rollup keys"), ("scan_ms", "scan, ms"),
+        ("lookup_ms", "rollup, ms"), ("speedup", "speedup"), ("build_ms", "full build, ms"),
+        ("refresh_one_ms", "refresh 1 product, ms"), ("same_result", "same result"),
+    ])
+    if not args.keep:
+        products.drop()
+        rollup.drop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+import argparse
+import re
+import time
+
+from pymongo import MongoClient
+
+from config import Config
+from utils import explain_agg_stats, print_table
+
+# Запросы по дереву категорий: старый вариант (по path / parent_path) и новый (по полям дерева из 03)
+
+def leaves_old():
+    # прежний $lookup искал детей по parent_path среди всех партнёров; is_leaf из 03 считается внутри партнёра,
+    # поэтому для сравнения один к одному дети ищутся только у того же партнёра
+    return [
+        {"$lookup": {"from": "categories", "localField": "path", "foreignField": "parent_path",
+                     "let": {"partner": "$partner"},
+                     "pipeline": [{"$match": {"$expr": {"$eq": ["$partner", "$$partner"]}}}, {"$limit": 1}, {"$project": {"_id": 1}}],
+                     "as": "children"}},
+        {"$match": {"children": {"$size": 0}}},
+        {"$sort": {"metadata.total_products": -1}},
+        {"$limit": 10},
+        {"$project": {"_id": 1, "metadata.total_products": 1}},
+    ]
+
+def leaves_new():
+    return [
+        {"$match": {"is_leaf": True}},
+        {"$sort": {"metadata.total_products": -1}},
+        {"$limit": 10},
+        {"$project": {"_id": 1, "metadata.total_products": 1}},
+    ]
+
+def subtree_old(node):
+    prefix = "^" + re.escape(node["path"] + "/")
+    return [
+        {"$match": {"partner": node["partner"], "$or": [{"path": node["path"]}, {"path": {"$regex": prefix}}]}},
+        {"$project": {"_id": 1}},
+    ]
+
+def subtree_new(node):
+    return [
+        {"$match": {"partner": node["partner"], "lft": {"$gte": node["lft"]}, "rgt": {"$lte": node["rgt"]}}},
+        {"$project": {"_id": 1}},
+    ]
+
+def ancestors_old(node):
+    parts = node["path_array"]
+    prefixes = ["/".join(parts[:i]) for i in range(1, len(parts))]
+    return [{"$match": {"partner": node["partner"], "path": {"$in": prefixes}}}, {"$project": {"_id": 1}}]
+
+def ancestors_new(node):
+    return [{"$match": {"_id": {"$in": node["ancestors"]}}}, {"$project": {"_id": 1}}]
+
+def _result_key(name: str, rows: list):
+    # у листьев с одинаковым total_products порядок не определён - сравниваем значения, а не _id
+    if name == "leaves_top10":
+        return [r["metadata"]["total_products"] for r in rows]
+    return sorted(r["_id"] for r in rows)
+
+def _pct(sorted_ms: list, p: float) -> float:
+    return sorted_ms[min(len(sorted_ms) - 1, int(p / 100.0 * len(sorted_ms)))]
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--repeat", type=int, default=20, help="прогонов каждого запроса")
+    args = ap.parse_args()
+
+    cfg = Config()
+    client = MongoClient(cfg.mongo_uri)
+    db = client[cfg.db_name]
+    col = db["categories"]
+
+    # самая глубокая из крупных категорий - для поддерева берём её корень, для предков - её саму
+    deep = list(col.find({"lft": {"$ne": None}}).sort([("level", -1), ("metadata.total_products", -1)]).limit(1))
+    if not deep or "is_leaf" not in deep[0]:
+        raise SystemExit("В categories нет полей дерева: перезапустите 03_task_1_2_load_categories.py")
+    deep = deep[0]
+    root = col.find_one({"partner": deep["partner"], "path": deep["path_array"][0]}) or deep
+    print("Категорий:", col.count_documents({}))
+    print("Поддерево:", root["_id"], root["path"], "| предки:", deep["_id"], deep["path"])
+
+    cases = [
+        ("leaves_top10", leaves_old(), leaves_new()),
+        ("subtree", subtree_old(root), subtree_new(root)),
+        ("ancestors", ancestors_old(deep), ancestors_new(deep)),
+    ]
+    rows = []
+    for name, old, new in cases:
+        results = {}
+        for variant, pipeline in (("old", old), ("new", new)):
+            times = []
+            for _ in range(args.repeat):
+                t0 = time.perf_counter()
+                res = list(col.aggregate(pipeline))
+                times.append((time.perf_counter() - t0) * 1000)
+            times.sort()
+            results[variant] = _result_key(name, res)
+            st = explain_agg_stats(db, "categories", pipeline)
+            rows.append({"query": name, "variant": variant, "p50_ms": round(_pct(times, 50), 2),
+                         "p95_ms": round(_pct(times, 95), 2), "returned": len(res), **st})
+        rows[-1]["same_result"] = rows[-2]["same_result"] = results["old"] == results["new"]
+
+    print_table("Дерево категорий: старые и новые запросы", rows, [
+        ("query", "query"), ("variant", "variant"), ("p50_ms", "p50, ms"), ("p95_ms", "p95, ms"),
+        ("returned", "returned"), ("keys_examined", "keysExamined"), ("docs_examined", "docsExamined"),
+        ("index", "index"), ("same_result", "same result"),
+    ])
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pyarrow as pa
+from pymongo import MongoClient
+
+from breadcrumb_rollup import ROLLUP, level_name_pipeline, level_reports_pipeline
+from config import Config
+from index_sets import INDEX_SETS, apply_index_set
+from utils import ResultReader, explain_agg_stats, print_table
+
+# Запросы 06-09 в том виде, в каком их отправляют скрипты (ResultReader: $match/$sort/$limit + плоский $project),
+# и count_documents из 06/07. Каждый набор индексов из index_sets.py прогоняется на всей смеси
+
+def _count(query: dict) -> list:
+    # так count_documents выглядит на сервере
+    return [{"$match": query}, {"$group": {"_id": 1, "n": {"$sum": 1}}}]
+
+CAT_FIELDS = {"name": ("$name", pa.string()), "total_products": ("$metadata.total_products", pa.int64()), "path": ("$path", pa.string())}
+Q_LEVEL1 = {"level": 1, "partner": "_ozon"}
+Q_PATH_ARRAY = {"path_array": "Строительство и ремонт"}
+Q_TYPE_BREADCRUMB = {"type": "Степлер строительный", "category.breadcrumbs.name": "Пневмоинструменты"}
+Q_LEVEL4 = {"category.breadcrumbs.3": {"$exists": True}}
+flat, find = ResultReader.flat_pipeline, ResultReader.find_pipeline
+
+QUERIES = [
+    ("06 count level1_ozon", "categories", _count(Q_LEVEL1)),
+    ("06 q1_level1_ozon", "categories", flat(find(Q_LEVEL1, limit=3), CAT_FIELDS)),
+    ("06 count path_array", "categories", _count(Q_PATH_ARRAY)),
+    ("06 q2_path_array", "categories", flat(find(Q_PATH_ARRAY, limit=3), {
+        "name": ("$name", pa.string()), "level": ("$level", pa.int64()), "path": ("$path", pa.string())})),
+    ("06 q3_top10_total_products", "categories",
+     flat(find({}, sort=[("metadata.total_products", -1)], limit=10), CAT_FIELDS)),
+    ("07 count type_breadcrumb", "products", _count(Q_TYPE_BREADCRUMB)),
+    ("07 q1_type_breadcrumb", "products", flat(find(Q_TYPE_BREADCRUMB, limit=3), {
+        "_id": ("$_id", pa.string()), "name": ("$name", pa.string()), "full_path": ("$category.full_path", pa.string())})),
+    ("07 count level4", "products", _count(Q_LEVEL4)),
+    ("07 q2_level4", "products", flat(find(Q_LEVEL4, limit=3), {
+        "_id": ("$_id", pa.string()), "name": ("$name", pa.string()),
+        "depth": ({"$size": {"$ifNull": ["$category.breadcrumbs", []]}}, pa.int64())})),
+    ("07 q3_root_categories", "products", flat([
+        {"$project": {"root": {"$arrayElemAt": ["$category.breadcrumbs", 0]}}},
+        {"$group": {"_id": "$root.name", "cnt": {"$sum": 1}}},
+        {"$sort": {"cnt": -1}},
+    ], {"root_category": ("$_id", pa.string()), "products_cnt": ("$cnt", pa.int64())})),
+    ("08 agg1_top10_categories", "products", flat([
+        {"$group": {"_id": "$category.id", "count": {"$sum": 1},
+                    "category_name": {"$first": "$category.name"}, "full_path": {"$first": "$category.full_path"}}},
+        {"$sort": {"count": -1}},
+        {"$limit": 10},
+    ], {"category_id": ("$_id", pa.string()), "name": ("$category_name", pa.string()),
+        "full_path": ("$full_path", pa.string()), "count": ("$count", pa.int64())})),
+    ("08 agg2_breadcrumbs_by_level", ROLLUP, flat(level_name_pipeline(30), {
+        "level": ("$_id.level", pa.int64()), "name": ("$_id.name", pa.string()), "cnt": ("$cnt", pa.int64())})),
+    ("08 level_reports", ROLLUP, level_reports_pipeline((1, 2, 3), 3)),
+    ("09 aggA_levels_by_partner", "categories", flat([
+        {"$group": {"_id": {"partner": "$partner", "level": "$level"},
+                    "categories_cnt": {"$sum": 1}, "products_sum": {"$sum": "$metadata.total_products"}}},
+        {"$sort": {"_id.partner": 1, "_id.level": 1}},
+    ], {"partner": ("$_id.partner", pa.string()), "level": ("$_id.level", pa.int64()),
+        "categories_cnt": ("$categories_cnt", pa.int64()), "products_sum": ("$products_sum", pa.int64())})),
+    ("09 aggB_top10_leaves", "categories", flat([
+        {"$match": {"is_leaf": True}},
+        {"$sort": {"metadata.total_products": -1}},
+        {"$limit": 10},
+        {"$project": {"partner": 1, "name": 1, "path": 1, "level": 1, "metadata.total_products": 1}},
+    ], {"partner": ("$partner", pa.string()), "level": ("$level", pa.int64()), "path": ("$path", pa.string()),
+        "total_products": ("$metadata.total_products", pa.int64())})),
+]
+
+def _pct(sorted_ms: list, p: float) -> float:
+    return sorted_ms[min(len(sorted_ms) - 1, int(p / 100.0 * len(sorted_ms)))]
+
+def run_query(col, pipeline: list, repeat: int, concurrency: int) -> dict:
+    def once(_):
+        t0 = time.perf_counter()
+        n = len(list(col.aggregate(pipeline)))
+        return (time.perf_counter() - t0) * 1000, n
+
+    once(None)  # прогрев: план в кэше, данные в памяти
+    t0 = time.perf_counter()
+    if concurrency > 1:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            runs = list(pool.map(once, range(repeat)))
+    else:
+        runs = [once(i) for i in range(repeat)]
+    wall = time.perf_counter() - t0
+    ms = sorted(t for t, _ in runs)
+    return {"p50_ms": round(_pct(ms, 50), 2), "p95_ms": round(_pct(ms, 95), 2), "p99_ms": round(_pct(ms, 99), 2),
+            "qps": round(repeat / wall, 1) if wall > 0 else None, "returned": runs[-1][1]}
+
+def index_usage(db) -> list:
+    # размер каждого индекса (collStats) и сколько раз им воспользовались с момента создания ($indexStats)
+    rows = []
+    for collection in ("categories", "products"):
+        sizes = db.command("collstats", collection).get("indexSizes", {})
+        try:
+            ops = {s["name"]: s["accesses"]["ops"] for s in db[collection].aggregate([{"$indexStats": {}}])}
+        except Exception:
+            ops = {}
+        for name, size in sizes.items():
+            rows.append({"collection": collection, "index": name, "size_kb": round(size / 1024, 1), "ops": ops.get(name, "n/a")})
+    return rows
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--index-sets", nargs="+", default=["baseline", "minimal", "compound", "partial", "covering"],
+                    choices=list(INDEX_SETS), help="наборы из index_sets.py (none - только _id)")
+    ap.add_argument("--queries", nargs="+", default=None, help="подстроки имён запросов (по умолчанию все)")
+    ap.add_argument("--repeat", type=int, default=50, help="прогонов каждого запроса")
+    ap.add_argument("--concurrency", type=int, default=1, help="параллельных запросов через пул соединений")
+    args = ap.parse_args()
+
+    cfg = Config()
+    client = MongoClient(cfg.mongo_uri, maxPoolSize=max(100, args.concurrency))
+    db = client[cfg.db_name]
+    queries = [q for q in QUERIES if not args.queries or any(s in q[0] for s in args.queries)]
+
+    rows, sizes = [], []
+    current = "baseline"  # None - набор применён не до конца
+    try:
+        for set_name in args.index_sets:
+            print(f"\n##### index set: {set_name} #####", flush=True)
+            current = None
+            apply_index_set(db, set_name)
+            current = set_name
+            for name, collection, pipeline in queries:
+                st = run_query(db[collection], pipeline, args.repeat, args.concurrency)
+                rows.append({"query": name, "index_set": set_name, **st, **explain_agg_stats(db, collection, pipeline)})
+                print(f"  {name}: p50 {st['p50_ms']} ms, p99 {st['p99_ms']} ms", flush=True)
+            usage = index_usage(db)
+            for r in usage:
+                r["index_set"] = set_name
+            sizes += usage
+            total_kb = sum(r["size_kb"] for r in usage)
+            print(f"  totalIndexSize categories + products: {total_kb:,.1f} KB", flush=True)
+    finally:
+        # стенд возвращается к индексам из 05, в том числе после ошибки / Ctrl-C посреди прогона
+        if current != "baseline":
+            apply_index_set(db, "baseline")
+
+    rows.sort(key=lambda r: (r["query"], args.index_sets.index(r["index_set"])))
+    print_table(f"Запросы 06-09 по наборам индексов (repeat={args.repeat}, concurrency={args.concurrency})", rows, [
+        ("query", "query"), ("index_set", "index set"), ("p50_ms", "p50, ms"), ("p95_ms", "p95, ms"),
+        ("p99_ms", "p99, ms"), ("qps", "qps"), ("keys_examined", "keysExamined"), ("docs_examined", "docsExamined"),
+        ("n_returned", "nReturned"), ("returned", "returned"), ("index", "index"),
+    ])
+    print_table("Индексы: размер и использование за прогон (ops из $indexStats, включая explain)", sizes, [
+        ("index_set", "index set"), ("collection", "collection"), ("index", "index"), ("size_kb", "size, KB"), ("ops", "ops"),
+    ])
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+from __future__ import annotations
+
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from bson import ObjectId
+
+# Витрина для отчётов 08: сколько товаров в каждой хлебной крошке (level, name) у каждого партнёра.
+# Отчёты читают её (тысячи документов), а не делают $unwind всех breadcrumbs всех товаров
+ROLLUP = "breadcrumb_rollup"
+
+def breadcrumb_keys(doc: Dict[str, Any]) -> Set[Tuple[str, str]]:
+    # (partner, name) - с такой точностью пересчитывается витрина после загрузки товаров
+    category = doc.get("category") or {}
+    return {(doc.get("partner"), b.get("name")) for b in category.get("breadcrumbs") or []}
+
+def _touched_filter(touched: Iterable[Tuple[str, str]], partner_field: str, name_field: str) -> Dict[str, Any]:
+    names = defaultdict(set)
+    for partner, name in touched:
+        names[partner].add(name)
+    return {"$or": [{partner_field: p, name_field: {"$in": sorted(n, key=str)}}
+                    for p, n in sorted(names.items(), key=lambda x: str(x[0]))]}
+
+def rollup_pipeline(into: str, refresh_id: ObjectId, touched: Optional[Set[Tuple[str, str]]] = None) -> List[Dict[str, Any]]:
+    pipeline: List[Dict[str, Any]] = []
+    if touched is not None:
+        # до $unwind: только товары, где есть затронутая крошка (idx_breadcrumbs_name), после - только сами крошки
+        pipeline.append({"$match": _touched_filter(touched, "partner", "category.breadcrumbs.name")})
+    pipeline.append({"$unwind": "$category.breadcrumbs"})
+    if touched is not None:
+        pipeline.append({"$match": _touched_filter(touched, "partner", "category.breadcrumbs.name")})
+    pipeline += [
+        {"$group": {
+            "_id": {"level": "$category.breadcrumbs.level", "name": "$category.breadcrumbs.name", "partner": "$partner"},
+            "cnt": {"$sum": 1},
+        }},
+        {"$set": {"level": "$_id.level", "name": "$_id.name", "partner": "$_id.partner", "refresh_id": refresh_id}},
+        {"$merge": {"into": into, "on": "_id", "whenMatched": "replace", "whenNotMatched": "insert"}},
+    ]
+    return pipeline
+
+def refresh_rollup(products, rollup, touched: Optional[Iterable[Tuple[str, str]]] = None) -> Dict[str, int]:
+    """Пересобирает витрину целиком (touched=None) или только ключи с (partner, name) из touched.
+
+    Каждый затронутый ключ считается заново по всем товарам, а не через +1/-1, поэтому частичный
+    пересчёт даёт то же, что полный. Ключи, у которых товаров не осталось, удаляются.
+    """
+    if touched is not None:
+        touched = set(touched)
+        if not touched:
+            return {"keys": 0, "removed": 0}
+    # удаление лишних ключей и пересчёт (partner, name) из touched идут по этому индексу
+    rollup.create_index([("partner", 1), ("name", 1)], name="idx_partner_name")
+    refresh_id = ObjectId()
+    list(products.aggregate(rollup_pipeline(rollup.name, refresh_id, touched), allowDiskUse=True))
+    scope = _touched_filter(touched, "partner", "name") if touched is not None else {}
+    removed = rollup.delete_many({**scope, "refresh_id": {"$ne": refresh_id}}).deleted_count
+    return {"keys": rollup.count_documents({"refresh_id": refresh_id}), "removed": removed}
+
+def level_name_pipeline(limit: int = 30) -> List[Dict[str, Any]]:
+    # Агрегация 2 из 08: (level, name) по всем партнёрам
+    return [
+        {"$group": {"_id": {"level": "$level", "name": "$name"}, "cnt": {"$sum": "$cnt"}}},
+        {"$sort": {"_id.level": 1, "cnt": -1, "_id.name": 1}},
+        {"$limit": limit},
+    ]
+
+def level_reports_pipeline(levels: Iterable[int] = (1, 2, 3), top: int = 3) -> List[Dict[str, Any]]:
+    # Итоги по уровням и топ имён на каждом уровне - одним запросом к витрине
+    facet = {"level_totals": [{"$group": {"_id": "$level", "cnt": {"$sum": "$cnt"}}}, {"$sort": {"cnt": -1, "_id": 1}}]}
+    for level in levels:
+        facet[f"top_level_{level}"] = [
+            {"$match": {"level": level}},
+            {"$group": {"_id": "$name", "cnt": {"$sum": "$cnt"}}},
+            {"$sort": {"cnt": -1, "_id": 1}},
+            {"$limit": top},
+        ]
+    return [{"$facet": facet}]
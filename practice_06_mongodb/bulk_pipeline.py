@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import queue
+import threading
+import time
+from typing import Any, Callable, List, Optional
+
+from pymongo.errors import BulkWriteError
+
+_STOP = object()
+
+def flush(col, ops: List[Any]) -> None:
+    try:
+        col.bulk_write(ops, ordered=False)
+    except BulkWriteError as e:
+        we = e.details.get("writeErrors", [])
+        print("BulkWriteError:", len(we), "errors")
+        if we:
+            print("First error:", we[0].get("errmsg"))
+        raise
+
+class BulkPipeline:
+    """bulk_write батчами из нескольких потоков-писателей поверх пула соединений одного MongoClient.
+
+    Производитель (цикл по parquet) только собирает операции и кладёт батчи в ограниченную очередь:
+    пока писатели ждут сеть, он строит следующие. Если сервер не успевает, add() блокируется.
+    """
+
+    def __init__(self, col, batch: int = 2000, writers: int = 4, queue_size: int = 0,
+                 range_batches: int = 1, progress=None) -> None:
+        self.col = col
+        self.batch = batch
+        # range_batches > 1: копим столько батчей, сортируем по _id и режем на непрерывные диапазоны,
+        # чтобы на шардированном кластере каждый bulk_write уходил в меньшее число чанков
+        self.range_batches = max(1, range_batches)
+        self.progress = progress  # multiprocessing.Value("q") - общий счётчик для нескольких процессов
+        self.written = 0
+        self._buf: List[tuple] = []
+        self._q: queue.Queue = queue.Queue(maxsize=queue_size or 2 * writers)
+        self._lock = threading.Lock()
+        self._error: Optional[BaseException] = None
+        self._threads = [threading.Thread(target=self._writer, daemon=True) for _ in range(max(1, writers))]
+        for t in self._threads:
+            t.start()
+
+    def _writer(self) -> None:
+        while True:
+            ops = self._q.get()
+            if ops is _STOP:
+                return
+            # после первой ошибки только вычерпываем очередь, чтобы производитель не повис на put()
+            if self._error is not None:
+                continue
+            try:
+                flush(self.col, ops)
+            except BaseException as e:
+                self._error = e
+                continue
+            with self._lock:
+                self.written += len(ops)
+            if self.progress is not None:
+                with self.progress.get_lock():
+                    self.progress.value += len(ops)
+
+    def add(self, doc_id: Any, op: Any) -> None:
+        self._buf.append((doc_id, op))
+        if len(self._buf) >= self.batch * self.range_batches:
+            self._emit()
+
+    def _emit(self) -> None:
+        if self._error is not None:
+            raise self._error
+        buf, self._buf = self._buf, []
+        if self.range_batches > 1:
+            buf.sort(key=lambda x: x[0])
+        for i in range(0, len(buf), self.batch):
+            self._q.put([op for _, op in buf[i:i + self.batch]])
+
+    def close(self) -> int:
+        if self._buf and self._error is None:
+            self._emit()
+        for _ in self._threads:
+            self._q.put(_STOP)
+        for t in self._threads:
+            t.join()
+        if self._error is not None:
+            raise self._error
+        return self.written
+
+class Progress:
+    """Раз в every секунд печатает, сколько документов записано и текущую скорость"""
+
+    def __init__(self, get_total: Callable[[], int], every: float = 2.0) -> None:
+        self.get_total = get_total
+        self.every = every
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        t0 = last_t = time.perf_counter()
+        last = 0
+        while not self._stop.wait(self.every):
+            total, now = self.get_total(), time.perf_counter()
+            print(f"  {total:>12,} docs  {(total - last) / (now - last_t):>10,.0f} docs/s"
+                  f"  (avg {total / (now - t0):,.0f})", flush=True)
+            last, last_t = total, now
+
+    def __enter__(self) -> "Progress":
+        self.t0 = time.perf_counter()
+        if self.every > 0:
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        self.elapsed = time.perf_counter() - self.t0
@@ -0,0 +1,115 @@
+import argparse
+import re
+import time
+
+from pymongo import MongoClient
+
+from category_trie import CategoryTrie
+from config import Config
+from utils import print_table, print_json
+
+# Навигация по категориям из CategoryTrie: поддерево, предки, автодополнение пути и поиск по началу имени.
+# Дерево строится из categories, из parquet или читается из снапшота (--load), --save пишет снапшот
+
+def _time_us(fn, repeat: int):
+    res = fn()
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return res, round((time.perf_counter() - t0) / repeat * 1e6, 2)
+
+def _mongo_queries(col, partner: str, args) -> dict:
+    # те же ответы запросами к MongoDB: path_array (multikey), префиксы пути, регулярка по name
+    out = {}
+    if args.subtree:
+        parts = args.subtree.split("/")
+        q = {"partner": partner, **{f"path_array.{i}": p for i, p in enumerate(parts)}}
+        out["subtree"] = lambda: list(col.find(q, {"_id": 1}))
+    if args.ancestors:
+        parts = args.ancestors.split("/")
+        prefixes = ["/".join(parts[:i]) for i in range(1, len(parts))]
+        out["ancestors"] = lambda: list(col.find({"partner": partner, "path": {"$in": prefixes}}, {"_id": 1}))
+    if args.complete:
+        *parents, last = args.complete.split("/")
+        q = {"partner": partner, "level": len(parents) + 1, "name": {"$regex": "^" + re.escape(last), "$options": "i"}}
+        if parents:
+            q["parent_path"] = "/".join(parents)
+        out["complete"] = lambda: list(col.find(q, {"_id": 1}).sort("metadata.subtree_products", -1).limit(args.limit))
+    return out
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--parquet", default=None, help="строить дерево из parquet (по умолчанию - из коллекции categories)")
+    ap.add_argument("--read-batch", type=int, default=100_000)
+    ap.add_argument("--load", default=None, help="взять дерево из снапшота вместо сборки")
+    ap.add_argument("--save", default=None, help="записать снапшот (.npz)")
+    ap.add_argument("--partner", default=None, help="по умолчанию - партнёр с наибольшим числом товаров")
+    ap.add_argument("--subtree", default=None, help="путь A/B: категории поддерева")
+    ap.add_argument("--ancestors", default=None, help="путь A/B/C: категории-предки")
+    ap.add_argument("--complete", default=None, help="начало пути A/Б: дети A, чьё имя начинается с Б")
+    ap.add_argument("--search", default=None, help="начало имени на любом уровне")
+    ap.add_argument("--limit", type=int, default=10)
+    ap.add_argument("--repeat", type=int, default=1000, help="повторов каждого запроса для замера, мкс")
+    ap.add_argument("--compare-mongo", action="store_true", help="замерить те же запросы к categories")
+    args = ap.parse_args()
+
+    cfg = Config()
+    t0 = time.perf_counter()
+    if args.load:
+        trie = CategoryTrie.load(args.load)
+    elif args.parquet:
+        trie = CategoryTrie.from_parquet(args.parquet, args.read_batch)
+    else:
+        trie = CategoryTrie.from_categories(MongoClient(cfg.mongo_uri)[cfg.db_name]["categories"])
+    print(f"Дерево: {len(trie):,} узлов, {len(trie.names):,} имён, {len(trie.roots)} партнёров, "
+          f"{(time.perf_counter() - t0) * 1000:.1f} ms ({trie.meta['source']}, {trie.meta['built_at']})")
+    if args.save:
+        trie.save(args.save)
+        print("Снапшот:", args.save)
+
+    partner = args.partner or max(trie.roots, key=lambda p: trie.subtree_products[trie.roots[p]], default=None)
+    if partner not in trie.roots:
+        raise SystemExit(f"Партнёра {partner!r} нет в дереве: {sorted(trie.roots)}")
+    root = trie.roots[partner]
+
+    def at(path: str, fn):
+        node = trie.find(partner, path)
+        return fn(node) if node >= 0 else []
+
+    queries = {}
+    if args.subtree:
+        queries["subtree"] = lambda: at(args.subtree, trie.subtree)
+    if args.ancestors:
+        queries["ancestors"] = lambda: at(args.ancestors, trie.ancestors)
+    if args.complete:
+        queries["complete"] = lambda: trie.complete(partner, args.complete, args.limit)
+    if args.search:
+        queries["search"] = lambda: trie.search(args.search, args.limit, within=root)
+    if not queries:
+        queries["top_level"] = lambda: trie.search("", args.limit, within=root, children_only=True)
+
+    mongo = _mongo_queries(MongoClient(cfg.mongo_uri)[cfg.db_name]["categories"], partner, args) if args.compare_mongo else {}
+    timing = []
+    for name, fn in queries.items():
+        nodes, us = _time_us(fn, args.repeat)
+        nodes = list(nodes)
+        row = {"query": name, "nodes": len(nodes), "trie_us": us}
+        if name in mongo:
+            docs, mongo_us = _time_us(mongo[name], max(1, args.repeat // 100))
+            row.update({"mongo_docs": len(docs), "mongo_us": mongo_us})
+        timing.append(row)
+        print_table(f"{name} ({partner})", [trie.info(n) for n in nodes[:args.limit]], [
+            ("path", "path"), ("level", "level"), ("children", "children"),
+            ("products", "products"), ("subtree_products", "subtree_products"),
+        ])
+        if len(nodes) > args.limit:
+            print(f"... ещё {len(nodes) - args.limit:,}")
+
+    print_table("Время на запрос (мкс)", timing, [
+        ("query", "query"), ("nodes", "nodes"), ("trie_us", "trie, us"), ("mongo_docs", "mongo docs"), ("mongo_us", "mongo, us"),
+    ])
+    if args.subtree and trie.find(partner, args.subtree) >= 0:
+        print_json("Узел поддерева", trie.info(trie.find(partner, args.subtree)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+from __future__ import annotations
+
+import json
+import os
+from bisect import bisect_left
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from utils import category_nodes, count_categories, utc_now_naive
+
+SNAPSHOT_VERSION = 1
+
+def _pack(strings: Sequence[str]) -> np.ndarray:
+    # список строк -> один uint8-массив (разделитель \0): снапшот без pickle
+    return np.frombuffer("\0".join(strings).encode("utf-8"), dtype=np.uint8)
+
+def _unpack(buf: np.ndarray) -> List[str]:
+    return bytes(buf).decode("utf-8").split("\0")
+
+class CategoryTrie:
+    """Дерево путей категорий в памяти процесса: навигация без запросов к MongoDB.
+
+    Узлы - все префиксы path_array внутри партнёра (корень - сам партнёр, depth 0), пронумерованы в порядке
+    обхода в глубину с детьми по имени. Поэтому поддерево узла i - это отрезок [i, end[i]), а дети лежат
+    в CSR-массивах child_offsets/children. Имена интернированы (name_id -> names), товары хранятся
+    собственные (products) и по поддереву (subtree_products).
+    """
+
+    def __init__(self, names: List[str], name_id: np.ndarray, parent: np.ndarray, depth: np.ndarray,
+                 products: np.ndarray, cat_offsets: np.ndarray, cat_ids: List[str], meta: Dict[str, Any]) -> None:
+        self.names = names
+        self.name_id = name_id
+        self.parent = parent
+        self.depth = depth
+        self.products = products
+        self.cat_offsets = cat_offsets
+        self.cat_ids = cat_ids
+        self.meta = meta
+
+        n = len(parent)
+        # размер поддерева: снизу вверх, каждый узел добавляет свой размер родителю (родитель всегда левее)
+        size = np.ones(n, dtype=np.int64)
+        for i in range(n - 1, -1, -1):
+            if parent[i] >= 0:
+                size[parent[i]] += size[i]
+        self.end = (np.arange(n) + size).astype(np.int32)
+        cs = np.concatenate([[0], np.cumsum(products)])
+        self.subtree_products = cs[self.end] - cs[:n]
+
+        kids = np.flatnonzero(parent >= 0)
+        self.children = kids[np.argsort(parent[kids], kind="stable")].astype(np.int32)
+        self.child_offsets = np.searchsorted(parent[self.children], np.arange(n + 1)).astype(np.int32)
+        self.roots = {names[name_id[i]]: int(i) for i in np.flatnonzero(parent < 0)}
+
+        # поиск по началу имени без учёта регистра: все узлы, кроме корней, по casefold-имени
+        folded = [s.casefold() for s in names]
+        keys = [folded[name_id[i]] for i in kids]
+        order = np.argsort(np.array(keys, dtype=object), kind="stable")
+        self._search_order = kids[order].astype(np.int32)
+        self._search_keys = [keys[i] for i in order]
+
+    @classmethod
+    def build(cls, nodes: Iterable[Tuple[str, str, Sequence[str], int]], source: str = "") -> "CategoryTrie":
+        """nodes: [(_id категории, partner, path_array, товаров)] - как в 03"""
+        own: Dict[Tuple[str, Tuple[str, ...]], List[Any]] = {}
+        for doc_id, partner, parts, total in nodes:
+            parts = tuple(parts)
+            for i in range(len(parts)):
+                own.setdefault((partner, parts[:i]), [0, []])
+            acc = own.setdefault((partner, parts), [0, []])
+            acc[0] += int(total or 0)
+            acc[1].append(doc_id)
+
+        # сортировка кортежей (partner, path) и есть обход в глубину с детьми по имени
+        keys = sorted(own)
+        index = {k: i for i, k in enumerate(keys)}
+        vocab: Dict[str, int] = {}
+        name_id = np.empty(len(keys), dtype=np.int32)
+        parent = np.empty(len(keys), dtype=np.int32)
+        depth = np.empty(len(keys), dtype=np.int16)
+        products = np.empty(len(keys), dtype=np.int64)
+        cat_offsets = np.zeros(len(keys) + 1, dtype=np.int32)
+        cat_ids: List[str] = []
+        for i, (partner, parts) in enumerate(keys):
+            name = parts[-1] if parts else partner
+            name_id[i] = vocab.setdefault(name, len(vocab))
+            parent[i] = index[(partner, parts[:-1])] if parts else -1
+            depth[i] = len(parts)
+            products[i], ids = own[(partner, parts)]
+            cat_ids += sorted(ids)
+            cat_offsets[i + 1] = len(cat_ids)
+        meta = {"version": SNAPSHOT_VERSION, "source": source, "built_at": utc_now_naive().isoformat()}
+        return cls(list(vocab), name_id, parent, depth, products, cat_offsets, cat_ids, meta)
+
+    @classmethod
+    def from_categories(cls, col) -> "CategoryTrie":
+        cursor = col.find({}, {"partner": 1, "path_array": 1, "metadata.total_products": 1})
+        return cls.build(((d["_id"], d.get("partner"), d.get("path_array") or [],
+                           (d.get("metadata") or {}).get("total_products", 0)) for d in cursor),
+                         source=f"mongodb:{col.full_name}")
+
+    @classmethod
+    def from_parquet(cls, path: str, batch_size: int = 100_000) -> "CategoryTrie":
+        return cls.build(category_nodes(count_categories(path, batch_size)), source=f"parquet:{os.path.basename(path)}")
+
+    def __len__(self) -> int:
+        return len(self.parent)
+
+    # --- навигация ---
+
+    def name(self, node: int) -> str:
+        return self.names[self.name_id[node]]
+
+    def child(self, node: int, name: str) -> int:
+        # дети отсортированы по имени: бинарный поиск по срезу CSR
+        lo, hi = self.child_offsets[node], self.child_offsets[node + 1]
+        i = bisect_left(self.children, name, lo, hi, key=self.name)
+        return int(self.children[i]) if i < hi and self.name(self.children[i]) == name else -1
+
+    def find(self, partner: str, path) -> int:
+        """Узел по пути ("A/B/C" или path_array); -1, если такого нет"""
+        node = self.roots.get(partner, -1)
+        for name in (path.split("/") if isinstance(path, str) else path):
+            if node < 0:
+                break
+            if name:
+                node = self.child(node, name)
+        return node
+
+    def path(self, node: int) -> str:
+        return "/".join(self.name(a) for a in self.ancestors(node) + [node])
+
+    def ancestors(self, node: int) -> List[int]:
+        # от категории 1-го уровня к родителю, без корня-партнёра
+        out = []
+        node = self.parent[node]
+        while node >= 0 and self.depth[node] > 0:
+            out.append(int(node))
+            node = self.parent[node]
+        return out[::-1]
+
+    def kids(self, node: int) -> np.ndarray:
+        return self.children[self.child_offsets[node]:self.child_offsets[node + 1]]
+
+    def subtree(self, node: int, max_depth: Optional[int] = None) -> np.ndarray:
+        # сам узел и все потомки; max_depth - не глубже стольких уровней от узла
+        nodes = np.arange(node, self.end[node], dtype=np.int32)
+        if max_depth is not None:
+            nodes = nodes[self.depth[nodes] <= self.depth[node] + max_depth]
+        return nodes
+
+    def category_ids(self, node: int) -> List[str]:
+        return self.cat_ids[self.cat_offsets[node]:self.cat_offsets[node + 1]]
+
+    def search(self, prefix: str, limit: int = 10, within: int = -1, children_only: bool = False) -> List[int]:
+        """Узлы, чьё имя начинается с prefix (без учёта регистра), по убыванию subtree_products.
+
+        within - только внутри поддерева этого узла (children_only - только его прямые дети).
+        """
+        key = prefix.casefold()
+        lo = bisect_left(self._search_keys, key)
+        hi = bisect_left(self._search_keys, key + "\U0010ffff", lo)
+        hits = self._search_order[lo:hi]
+        if within >= 0:
+            hits = hits[(hits > within) & (hits < self.end[within])]
+            if children_only:
+                hits = hits[self.parent[hits] == within]
+        weight = self.subtree_products[hits]
+        if len(hits) > limit:
+            top = np.argpartition(-weight, limit)[:limit]
+            hits, weight = hits[top], weight[top]
+        return hits[np.argsort(-weight, kind="stable")].tolist()
+
+    def complete(self, partner: str, text: str, limit: int = 10) -> List[int]:
+        """Автодополнение пути: "Строительство и ремонт/Инстр" -> дети узла по началу последней части"""
+        *parents, last = text.split("/")
+        node = self.find(partner, parents)
+        if node < 0:
+            return []
+        return self.search(last, limit, within=node, children_only=True)
+
+    def info(self, node: int) -> Dict[str, Any]:
+        return {
+            "path": self.path(node),
+            "level": int(self.depth[node]),
+            "children": int(self.child_offsets[node + 1] - self.child_offsets[node]),
+            "products": int(self.products[node]),
+            "subtree_products": int(self.subtree_products[node]),
+            "category_ids": self.category_ids(node),
+        }
+
+    # --- снапшот ---
+
+    def save(self, path: str) -> None:
+        # пишем во временный файл и подменяем: читатель никогда не увидит недописанный снапшот
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            np.savez(f, names=_pack(self.names), name_id=self.name_id, parent=self.parent, depth=self.depth,
+                     products=self.products, cat_offsets=self.cat_offsets, cat_ids=_pack(self.cat_ids),
+                     meta=_pack([json.dumps(self.meta)]))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "CategoryTrie":
+        with np.load(path) as z:
+            meta = json.loads(_unpack(z["meta"])[0])
+            if meta.get("version") != SNAPSHOT_VERSION:
+                raise ValueError(f"{path}: snapshot version {meta.get('version')}, expected {SNAPSHOT_VERSION}")
+            cat_ids = _unpack(z["cat_ids"]) if len(z["cat_ids"]) else []
+            return cls(_unpack(z["names"]), z["name_id"], z["parent"], z["depth"], z["products"],
+                       z["cat_offsets"], cat_ids, meta)
+
+class TrieSnapshot:
+    """Текущее дерево из файла снапшота для долгоживущего сервиса.
+
+    reload() перечитывает файл, только если он изменился, и подменяет ссылку trie целиком: запросы,
+    начатые на старом дереве, доработают на нём, новые пойдут в новое.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.trie: Optional[CategoryTrie] = None
+        self._stamp = None
+        self.reload()
+
+    def reload(self) -> bool:
+        st = os.stat(self.path)
+        stamp = (st.st_mtime_ns, st.st_size)
+        if stamp == self._stamp:
+            return False
+        self.trie = CategoryTrie.load(self.path)
+        self._stamp = stamp
+        return True
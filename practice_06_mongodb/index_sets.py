@@ -0,0 +1,87 @@
+from typing import Dict, List
+
+from pymongo import IndexModel
+
+# Наборы индексов для categories / products. BASELINE создаёт 05, остальные сравнивает bench_queries.py
+# на запросах 06-09: сколько каждый набор экономит keysExamined/docsExamined и сколько весит
+
+BASELINE: Dict[str, List[IndexModel]] = {
+    "categories": [
+        IndexModel([("path", "text")], name="idx_text_path"),
+        IndexModel([("path_array", 1)], name="idx_path_array"),
+        IndexModel([("partner", 1), ("level", 1)], name="idx_partner_level"),
+        IndexModel([("metadata.total_products", -1)], name="idx_total_products"),
+        # дерево категорий (03): листья по total_products, поддерево по nested set, потомки по ancestors
+        IndexModel([("is_leaf", 1), ("metadata.total_products", -1)], name="idx_leaf_total_products"),
+        IndexModel([("partner", 1), ("lft", 1), ("rgt", 1)], name="idx_partner_nested_set"),
+        IndexModel([("ancestors", 1)], name="idx_ancestors"),
+    ],
+    "products": [
+        IndexModel([("partner", 1), ("category.id", 1)], name="idx_partner_categoryid"),
+        IndexModel([("category.breadcrumbs.name", 1)], name="idx_breadcrumbs_name"),
+        IndexModel([("type", 1), ("partner", 1)], name="idx_type_partner"),
+        IndexModel([("offer_id", 1)], name="idx_offer_id"),
+    ],
+}
+
+# только то, что выбирают запросы 06-09
+MINIMAL = {
+    "categories": [
+        IndexModel([("path_array", 1)], name="idx_path_array"),
+        IndexModel([("partner", 1), ("level", 1)], name="idx_partner_level"),
+        IndexModel([("metadata.total_products", -1)], name="idx_total_products"),
+        IndexModel([("is_leaf", 1), ("metadata.total_products", -1)], name="idx_leaf_total_products"),
+    ],
+    "products": [
+        IndexModel([("category.breadcrumbs.name", 1)], name="idx_breadcrumbs_name"),
+    ],
+}
+
+# запрос 1 из 07 (type + крошка) одним составным индексом вместо двух одиночных
+COMPOUND = {
+    "categories": MINIMAL["categories"],
+    "products": [
+        IndexModel([("type", 1), ("category.breadcrumbs.name", 1)], name="idx_type_breadcrumbs"),
+    ],
+}
+
+# листья по total_products: в индексе только is_leaf=true
+PARTIAL = {
+    "categories": [
+        IndexModel([("path_array", 1)], name="idx_path_array"),
+        IndexModel([("partner", 1), ("level", 1)], name="idx_partner_level"),
+        IndexModel([("metadata.total_products", -1)], name="idx_total_products"),
+        IndexModel([("is_leaf", 1), ("metadata.total_products", -1)], name="idx_leaf_total_products_partial",
+                   partialFilterExpression={"is_leaf": True}),
+    ],
+    "products": COMPOUND["products"],
+}
+
+# запросы 1 и 3 из 06 отвечают из индекса, не читая документы (в их выдаче нет _id)
+COVERING = {
+    "categories": [
+        IndexModel([("path_array", 1)], name="idx_path_array"),
+        IndexModel([("partner", 1), ("level", 1), ("name", 1), ("metadata.total_products", 1), ("path", 1)],
+                   name="idx_partner_level_cover"),
+        IndexModel([("metadata.total_products", -1), ("name", 1), ("path", 1)], name="idx_total_products_cover"),
+        # $project в B из 09 оставляет _id и name, так что его индексом не покрыть
+        IndexModel([("is_leaf", 1), ("metadata.total_products", -1)], name="idx_leaf_total_products"),
+    ],
+    "products": COMPOUND["products"],
+}
+
+INDEX_SETS = {
+    "none": {"categories": [], "products": []},
+    "baseline": BASELINE,
+    "minimal": MINIMAL,
+    "compound": COMPOUND,
+    "partial": PARTIAL,
+    "covering": COVERING,
+}
+
+def apply_index_set(db, name: str) -> None:
+    # _id не трогаем, остальные индексы categories / products заменяются набором
+    for collection, models in INDEX_SETS[name].items():
+        db[collection].drop_indexes()
+        if models:
+            db[collection].create_indexes(models)
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# скрипты практики импортируют соседние модули по имени (from utils import ...)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
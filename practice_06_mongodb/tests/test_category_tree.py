@@ -0,0 +1,23 @@
+import importlib.util
+import os
+
+_spec = importlib.util.spec_from_file_location(
+    "load_categories", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "03_task_1_2_load_categories.py"))
+load_categories = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(load_categories)
+
+def test_leaves_are_per_partner_when_paths_are_shared():
+    # у обоих партнёров есть "A", дочерний путь "A/B" - только у _ozon
+    nodes = [
+        ("_ozon_1", "_ozon", ["A"], 5),
+        ("_ozon_2", "_ozon", ["A", "B"], 3),
+        ("_wb_1", "_wb", ["A"], 7),
+    ]
+    tree = load_categories._tree_metadata(nodes)
+    assert (tree["_ozon_1"]["is_leaf"], tree["_ozon_1"]["child_count"]) == (False, 1)
+    assert (tree["_wb_1"]["is_leaf"], tree["_wb_1"]["child_count"]) == (True, 0)
+    assert tree["_ozon_2"]["ancestors"] == ["_ozon_1"]
+    assert tree["_ozon_1"]["subtree_products"] == 8
+    assert tree["_wb_1"]["subtree_products"] == 7
+    # nested set у каждого партнёра свой, с нуля
+    assert (tree["_ozon_1"]["lft"], tree["_wb_1"]["lft"]) == (1, 1)
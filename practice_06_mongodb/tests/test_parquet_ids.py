@@ -0,0 +1,30 @@
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from utils import count_categories, iter_parquet_batches
+
+def _write(path, row_group_size=3):
+    # без pandas-метаданных, null в Category_ID / Offer_ID только в первой row group
+    table = pa.table({
+        "Partner_Name": ["Ozon"] * 6,
+        "Category_ID": pa.array([57, None, 57, 57, 57, 57], type=pa.int64()),
+        "Category_FullPathName": ["A\\B"] * 6,
+        "Offer_ID": pa.array([1, None, 2, 1, 3, 2], type=pa.int64()),
+    })
+    pq.write_table(table, path, row_group_size=row_group_size)
+
+def test_count_categories_same_key_across_row_groups(tmp_path):
+    path = str(tmp_path / "ids.pq")
+    _write(path)
+    cats = count_categories(path, batch_size=3)
+    assert {k: v[0] for k, v in cats.items()} == {("_ozon", "57"): 5}
+
+def test_string_ids_do_not_depend_on_nulls_in_batch(tmp_path):
+    path = str(tmp_path / "ids.pq")
+    _write(path)
+    offers = []
+    for batch in iter_parquet_batches(path, ["Offer_ID", "Category_ID"], 3, string_ids=["Offer_ID", "Category_ID"]):
+        df = batch.to_pandas()
+        offers += df["Offer_ID"].astype(str).tolist()
+        assert set(df["Category_ID"].dropna().astype(str)) == {"57"}
+    assert [o for o in offers if isinstance(o, str)] == ["1", "2", "1", "3", "2"]
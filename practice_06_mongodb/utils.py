@@ -1,12 +1,27 @@
 from __future__ import annotations
 
+import hashlib
 import json
+import os
 import re
 from datetime import datetime
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 
+import bson
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
 from tabulate import tabulate
 
+from config import normalize_partner
+
+try:
+    from pymongoarrow.api import Schema, aggregate_arrow_all
+except ImportError:
+    Schema = aggregate_arrow_all = None
+
 def split_category_path(full_path_name: str) -> List[str]:
     if full_path_name is None:
         return []
@@ -22,6 +37,116 @@ def parent_path_slash(parts: List[str]) -> Optional[str]:
         return None
     return "/".join(parts[:-1])
 
+def iter_parquet_batches(path: str, columns: List[str], batch_size: int = 100_000,
+                         row_groups: Optional[List[int]] = None, read_dictionary: Optional[List[str]] = None,
+                         string_ids: Optional[List[str]] = None) -> Iterator[pa.RecordBatch]:
+    # Читаем только нужные колонки и по batch_size строк: в памяти одна row group, а не весь файл.
+    # read_dictionary: эти колонки приходят dictionary-encoded (повторяющиеся строки - один раз на батч).
+    # string_ids: целочисленные id-колонки приводятся к строке в Arrow. Иначе to_pandas() решает по каждому
+    # батчу отдельно: батч с null даёт float64 и "57.0", батч без null - int64 и "57"
+    pf = pq.ParquetFile(path, read_dictionary=read_dictionary)
+    missing = [c for c in columns if c not in pf.schema_arrow.names]
+    if missing:
+        raise SystemExit(f"Missing columns in parquet: {missing}")
+    cast = {c for c in (string_ids or []) if pa.types.is_integer(pf.schema_arrow.field(c).type)}
+    for batch in pf.iter_batches(batch_size=batch_size, columns=columns, row_groups=row_groups):
+        if cast:
+            # без схемных метаданных: pandas-метаданные файла описывают эти колонки как целые
+            batch = pa.RecordBatch.from_arrays(
+                [pc.cast(batch.column(n), pa.string()) if n in cast else batch.column(n) for n in batch.schema.names],
+                names=batch.schema.names)
+        yield batch
+
+def category_depths(paths: pa.Array) -> np.ndarray:
+    """len(split_category_path(x)) для каждого элемента, векторно (null -> 0)"""
+    parts = pc.split_pattern_regex(pc.utf8_trim_whitespace(paths), r"\\+")
+    flat = pc.utf8_trim_whitespace(pc.list_flatten(parts))
+    owner = pc.list_parent_indices(parts).to_numpy()
+    nonempty = pc.greater(pc.utf8_length(flat), 0).to_numpy(zero_copy_only=False)
+    return np.bincount(owner[nonempty], minlength=len(paths))
+
+def count_categories(path: str, batch_size: int = 100_000) -> Dict[Tuple[str, str], List[Any]]:
+    """(partner, category_id) -> [товаров, первый непустой Category_FullPathName] по всему parquet"""
+    # Категорий на порядки меньше, чем строк: копим счётчики по батчам, весь файл в памяти не нужен
+    cats: Dict[Tuple[str, str], List[Any]] = {}
+    for batch in iter_parquet_batches(path, ["Partner_Name", "Category_ID", "Category_FullPathName"], batch_size,
+                                      string_ids=["Category_ID"]):
+        df = batch.to_pandas()
+        df["partner"] = df["Partner_Name"].map(normalize_partner)
+        df["category_id"] = df["Category_ID"].astype(str)
+        g = df.groupby(["partner","category_id"], sort=False)["Category_FullPathName"].agg(["size", "first"])
+        for key, size, first in zip(g.index, g["size"], g["first"]):
+            acc = cats.get(key)
+            if acc is None:
+                cats[key] = [int(size), None if pd.isna(first) else first]
+            else:
+                acc[0] += int(size)
+                if acc[1] is None and not pd.isna(first):
+                    acc[1] = first
+    return cats
+
+def category_nodes(cats: Dict[Tuple[str, str], List[Any]]) -> List[Tuple[str, str, List[str], int]]:
+    # [(_id категории, partner, path_array, товаров)] в порядке cats
+    return [(f"{partner}_{category_id}", partner, split_category_path(full_path_name), total_products)
+            for (partner, category_id), (total_products, full_path_name) in cats.items()]
+
+def map_unique(values: pd.Series, fn: Callable[[Any], Any], memo: Optional[Dict[Any, Any]] = None) -> np.ndarray:
+    """fn по каждому значению колонки, но вызывается один раз на уникальное значение (с memo - за всё время)"""
+    codes, uniques = pd.factorize(values)
+    if memo is None:
+        memo = {}
+    # последний элемент - для пропусков (None/NaN, код -1): fn получает само пропущенное значение
+    table = np.empty(len(uniques) + 1, dtype=object)
+    for i, u in enumerate(uniques):
+        if u not in memo:
+            memo[u] = fn(u)
+        table[i] = memo[u]
+    missing = codes == -1
+    if missing.any():
+        table[-1] = fn(values[missing].iloc[0])
+    return table[codes]
+
+def key_hash(keys: pd.Series) -> np.ndarray:
+    return pd.util.hash_pandas_object(keys, index=False).to_numpy()
+
+class SeenKeys:
+    """Уже встреченные ключи между батчами: 8 байт на ключ (64-битный хэш) вместо строк"""
+
+    def __init__(self) -> None:
+        # отсортированные непересекающиеся прогоны; сливаем как в двоичном счётчике, их O(log n)
+        self._runs: List[np.ndarray] = []
+
+    def __len__(self) -> int:
+        return sum(len(r) for r in self._runs)
+
+    def _contains(self, h: np.ndarray) -> np.ndarray:
+        mask = np.zeros(len(h), dtype=bool)
+        for run in self._runs:
+            pos = np.minimum(np.searchsorted(run, h), len(run) - 1)
+            mask |= run[pos] == h
+        return mask
+
+    def contains(self, keys: pd.Series) -> np.ndarray:
+        return self._contains(key_hash(keys))
+
+    def first_seen(self, keys: pd.Series) -> np.ndarray:
+        """Маска строк, чей ключ встретился впервые (как drop_duplicates(keep="first") по всему файлу)"""
+        h = key_hash(keys)
+        mask = np.zeros(len(h), dtype=bool)
+        mask[np.unique(h, return_index=True)[1]] = True
+        mask &= ~self._contains(h)
+        new = np.sort(h[mask])
+        if len(new):
+            self._runs.append(new)
+            while len(self._runs) > 1 and len(self._runs[-2]) <= len(self._runs[-1]):
+                last = self._runs.pop()
+                self._runs[-1] = np.sort(np.concatenate([self._runs[-1], last]))
+        return mask
+
+def content_hash(doc: Dict[str, Any]) -> int:
+    # 64 бита blake2b от BSON документа; порядок ключей задан кодом загрузчика, так что хэш стабилен между запусками
+    return int.from_bytes(hashlib.blake2b(bson.encode(doc), digest_size=8).digest(), "big", signed=True)
+
 def utc_now_naive() -> datetime:
     return datetime.utcnow()
 
@@ -48,6 +173,61 @@ def print_table(title: str, rows: List[Dict[str, Any]], columns: List[Tuple[str,
         data.append([r.get(k, "") for k, _ in columns])
     print(tabulate(data, headers=headers, tablefmt="github"))
 
+class ResultReader:
+    """Результаты запросов сразу плоскими строками для print_table.
+
+    fields: {колонка: (выражение $project, тип pyarrow)} - документы уплощаются на сервере, с клиента уходит
+    только то, что печатается. С arrow=True (или export_dir) результат декодирует pymongoarrow прямо
+    в Arrow-колонки, минуя dict на документ; без pymongoarrow - обычный курсор и pa.Table.from_pylist.
+    export_dir: каждый результат ещё и пишется в <export_dir>/<name>.parquet.
+    """
+
+    def __init__(self, arrow: bool = False, export_dir: Optional[str] = None) -> None:
+        self.arrow = arrow or export_dir is not None
+        self.export_dir = export_dir
+        if export_dir:
+            os.makedirs(export_dir, exist_ok=True)
+
+    @staticmethod
+    def _projection(fields: Dict[str, Tuple[Any, Any]]) -> Dict[str, Any]:
+        return {"_id": 0, **{k: expr for k, (expr, _) in fields.items()}}
+
+    def _finish(self, name: str, table: pa.Table) -> List[Dict[str, Any]]:
+        if self.export_dir:
+            pq.write_table(table, os.path.join(self.export_dir, f"{name}.parquet"))
+        return table.to_pylist()
+
+    def _schema(self, fields: Dict[str, Tuple[Any, Any]]) -> pa.Schema:
+        return pa.schema([(k, t) for k, (_, t) in fields.items()])
+
+    @classmethod
+    def flat_pipeline(cls, pipeline: List[Dict[str, Any]], fields: Dict[str, Tuple[Any, Any]]) -> List[Dict[str, Any]]:
+        return pipeline + [{"$project": cls._projection(fields)}]
+
+    @staticmethod
+    def find_pipeline(query: Dict[str, Any], sort: Optional[List[Tuple[str, int]]] = None, limit: int = 0) -> List[Dict[str, Any]]:
+        # find(query).sort().limit() как $match/$sort/$limit: те же индексы, зато один путь декодирования
+        pipeline: List[Dict[str, Any]] = [{"$match": query}]
+        if sort:
+            pipeline.append({"$sort": dict(sort)})
+        if limit:
+            pipeline.append({"$limit": limit})
+        return pipeline
+
+    def aggregate(self, col, pipeline: List[Dict[str, Any]], fields: Dict[str, Tuple[Any, Any]], name: str) -> List[Dict[str, Any]]:
+        flat = self.flat_pipeline(pipeline, fields)
+        if not self.arrow:
+            return list(col.aggregate(flat))
+        if aggregate_arrow_all is not None:
+            table = aggregate_arrow_all(col, flat, schema=Schema({k: t for k, (_, t) in fields.items()}))
+        else:
+            table = pa.Table.from_pylist(list(col.aggregate(flat)), schema=self._schema(fields))
+        return self._finish(name, table)
+
+    def find(self, col, query: Dict[str, Any], fields: Dict[str, Tuple[Any, Any]], name: str,
+             sort: Optional[List[Tuple[str, int]]] = None, limit: int = 0) -> List[Dict[str, Any]]:
+        return self.aggregate(col, self.find_pipeline(query, sort, limit), fields, name)
+
 def extract_index_used_from_explain(explain: Dict[str, Any]) -> str:
     qp = explain.get("queryPlanner", {}) or {}
     wp = qp.get("winningPlan", {}) or {}
@@ -76,25 +256,65 @@ def extract_index_used_from_explain(explain: Dict[str, Any]) -> str:
     res = walk(wp)
     return res or "UNKNOWN"
 
-def explain_agg_time_ms(db, collection_name: str, pipeline: List[Dict[str, Any]]) -> Optional[int]:
+def _find_int(d: Any, key: str) -> Optional[int]:
+    if isinstance(d, dict):
+        if key in d and isinstance(d[key], int):
+            return d[key]
+        for v in d.values():
+            r = _find_int(v, key)
+            if r is not None:
+                return r
+    elif isinstance(d, list):
+        for it in d:
+            r = _find_int(it, key)
+            if r is not None:
+                return r
+    return None
+
+def _sum_ints(d: Any, key: str) -> int:
+    # по всем стадиям и шардам: у $lookup свои totalDocsExamined
+    if isinstance(d, dict):
+        own = d[key] if isinstance(d.get(key), int) else 0
+        return own + sum(_sum_ints(v, key) for v in d.values())
+    if isinstance(d, list):
+        return sum(_sum_ints(it, key) for it in d)
+    return 0
+
+def explain_agg(db, collection_name: str, pipeline: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
     try:
-        exp = db.command("explain", {"aggregate": collection_name, "pipeline": pipeline, "cursor": {}}, verbosity="executionStats")
+        return db.command("explain", {"aggregate": collection_name, "pipeline": pipeline, "cursor": {}}, verbosity="executionStats")
     except Exception:
         return None
 
-    def find_int(d, key):
-        if isinstance(d, dict):
-            if key in d and isinstance(d[key], int):
-                return d[key]
-            for v in d.values():
-                r = find_int(v, key)
-                if r is not None:
-                    return r
-        elif isinstance(d, list):
-            for it in d:
-                r = find_int(it, key)
-                if r is not None:
-                    return r
+def explain_agg_time_ms(db, collection_name: str, pipeline: List[Dict[str, Any]]) -> Optional[int]:
+    exp = explain_agg(db, collection_name, pipeline)
+    if exp is None:
         return None
+    return _find_int(exp, "executionTimeMillis") or _find_int(exp, "executionTimeMillisEstimate")
+
+def explain_agg_stats(db, collection_name: str, pipeline: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """keysExamined / docsExamined суммарно по плану, nReturned запроса к коллекции, индекс из winningPlan"""
+    exp = explain_agg(db, collection_name, pipeline) or {}
+    plan = exp if "queryPlanner" in exp else (_find_dict(exp, "queryPlanner") or {})
+    return {
+        "keys_examined": _sum_ints(exp, "totalKeysExamined"),
+        "docs_examined": _sum_ints(exp, "totalDocsExamined"),
+        "n_returned": _find_int(exp, "nReturned"),
+        "index": extract_index_used_from_explain(plan),
+    }
 
-    return find_int(exp, "executionTimeMillis") or find_int(exp, "executionTimeMillisEstimate")
+def _find_dict(d: Any, key: str) -> Optional[Dict[str, Any]]:
+    # первый вложенный объект, у которого есть key (explain aggregate прячет queryPlanner в stages[0].$cursor)
+    if isinstance(d, dict):
+        if isinstance(d.get(key), dict):
+            return d
+        for v in d.values():
+            r = _find_dict(v, key)
+            if r is not None:
+                return r
+    elif isinstance(d, list):
+        for it in d:
+            r = _find_dict(it, key)
+            if r is not None:
+                return r
+    return None
@@ -1,31 +1,104 @@
+import argparse
+import asyncio
+import hashlib
+import itertools
+import json
+import math
+import os
+import random
+import subprocess
+import threading
 import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from statistics import mean
 import datetime
 from clickhouse_driver import Client
 from docx import Document
 
-LOG_TXT = None
-DOC = None
+from ch_cache import QueryCache
+from ch_sql import read_sql_statements
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+REPORT = []
+RESULTS = []
 
 def log(message: str = "") -> None:
+    # В txt/docx пишем не сразу, а в render_report() после замеров: python-docx
+    # с ростом документа тормозит и не должен попадать в измеряемое время
     print(message)
-    if LOG_TXT is not None:
-        LOG_TXT.write(message + "\n")
-    if DOC is not None:
-        DOC.add_paragraph(message)
-
-CLICKHOUSE_HOST = "localhost"
-CLICKHOUSE_PORT = 9000       
-CLICKHOUSE_DB = "ecom"       
+    REPORT.append(message)
+
+
+def render_report(base_name: str) -> list:
+    with open(base_name + ".txt", "w", encoding="utf-8") as f:
+        f.write("\n".join(REPORT) + "\n")
+    saved = [base_name + ".txt"]
+
+    # Готовим Word-документ, если библиотека доступна
+    if Document is not None:
+        doc = Document()
+        doc.add_heading("ClickHouse load test", level=1)
+        for message in REPORT:
+            doc.add_paragraph(message)
+        doc.save(base_name + ".docx")
+        saved.append(base_name + ".docx")
+    return saved
+
+# Подключение можно переопределить переменными окружения (так gen_data.py --bench передаёт свой стенд)
+CLICKHOUSE_HOST = os.environ.get("CLICKHOUSE_HOST", "localhost")
+CLICKHOUSE_PORT = int(os.environ.get("CLICKHOUSE_PORT", 9000))
+CLICKHOUSE_HTTP_PORT = int(os.environ.get("CLICKHOUSE_HTTP_PORT", 8123))
+CLICKHOUSE_DB = os.environ.get("CLICKHOUSE_DB", "ecom")
+CLICKHOUSE_USER = os.environ.get("CLICKHOUSE_USER", "benchmark")
+CLICKHOUSE_PASSWORD = os.environ.get("CLICKHOUSE_PASSWORD", "")
+CLICKHOUSE_ADMIN_USER = os.environ.get("CLICKHOUSE_ADMIN_USER", "default")   # только для ALTER в --mode variants
+CLICKHOUSE_ADMIN_PASSWORD = os.environ.get("CLICKHOUSE_ADMIN_PASSWORD", "")
+VARIANTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "clickhouse", "variants")
 ITERATIONS = 30              
 
-client = Client(
-    host="localhost",
-    port=9000,
-    database="ecom",
-    user="benchmark",
-    password=""
-)
+
+def record_result(name: str, mode: str, latencies, errors: int = 0, metrics: dict = None, **extra) -> dict:
+    # Сырые замеры в машиночитаемом виде: из них потом сравниваются прогоны (compare_results.py).
+    # extra - параметры прогона (входят в ключ), metrics - посчитанные величины (в ключ не входят)
+    level = ",".join(f"{k}={v}" for k, v in sorted(extra.items()))
+    rec = {
+        "type": "query",
+        "key": f"{mode}:{name}" + (f"@{level}" if level else ""),
+        "name": name,
+        "mode": mode,
+        "errors": errors,
+        **extra,
+        **(metrics or {}),
+    }
+    if isinstance(latencies, LatencyHistogram):
+        rec["histogram"] = latencies.to_dict()
+    else:
+        rec["latencies"] = [round(t, 6) for t in latencies]
+    RESULTS.append(rec)
+    return rec
+
+
+def make_client(user: str = CLICKHOUSE_USER, password: str = CLICKHOUSE_PASSWORD) -> Client:
+    return Client(
+        host=CLICKHOUSE_HOST,
+        port=CLICKHOUSE_PORT,
+        database=CLICKHOUSE_DB,
+        user=user,
+        password=password
+    )
+
+
+client = make_client()
 
 
 
@@ -45,8 +118,9 @@ LIMIT 20
 MV_TOP_CATEGORIES = """
 SELECT
     category_id,
-    offers_cnt
+    sum(offers_cnt) AS offers_cnt
 FROM catalog_by_category_mv
+GROUP BY category_id
 ORDER BY offers_cnt DESC
 LIMIT 20
 """
@@ -95,8 +169,16 @@ ORDER BY avg_offers_per_brand DESC
 MV_AVG_OFFERS_PER_BRAND = """
 SELECT
     category_id,
-    avg(offers_cnt) AS avg_offers_per_brand
-FROM catalog_by_brand_mv
+    avg(offers_per_brand) AS avg_offers_per_brand
+FROM
+(
+    SELECT
+        category_id,
+        vendor,
+        sum(offers_cnt) AS offers_per_brand
+    FROM catalog_by_brand_mv
+    GROUP BY category_id, vendor
+)
 GROUP BY category_id
 ORDER BY avg_offers_per_brand DESC
 """
@@ -119,7 +201,7 @@ LEFT JOIN
 WHERE e.offer_id IS NULL
 """
 
-# Analysis of products without events through MV
+# Products without events through offer_last_seen (one row per seen offer, no JOIN)
 MV_OFFERS_WITHOUT_EVENTS = """
 SELECT
     o.offer_id,
@@ -127,9 +209,25 @@ SELECT
     o.vendor,
     o.price
 FROM ecom_offers AS o
-LEFT JOIN offer_events_mv AS ev
-    ON o.offer_id = ev.offer_id
-WHERE ev.offer_id IS NULL
+WHERE o.offer_id NOT IN
+(
+    SELECT offer_id
+    FROM offer_last_seen
+)
+"""
+
+# Last time a product was seen: full scan of raw_events vs primary key lookup in offer_last_seen.
+# offer_id is resolved once before the timing loop (QUERY_PARAMS), so only the lookup itself is timed
+RAW_OFFER_LAST_SEEN = """
+SELECT max(Hour)
+FROM raw_events
+WHERE ContentUnitID = %(offer_id)s
+"""
+
+MV_OFFER_LAST_SEEN = """
+SELECT max(last_seen)
+FROM offer_last_seen
+WHERE offer_id = %(offer_id)s
 """
 
 
@@ -145,20 +243,112 @@ QUERIES = {
 
     "raw_offers_without_events": RAW_OFFERS_WITHOUT_EVENTS,
     "mv_offers_without_events": MV_OFFERS_WITHOUT_EVENTS,
+
+    "raw_offer_last_seen": RAW_OFFER_LAST_SEEN,
+    "mv_offer_last_seen": MV_OFFER_LAST_SEEN,
+}
+
+# Параметры запросов из QUERIES: SQL, который один раз вычисляет значение до замеров
+LAST_SEEN_OFFER_ID = "SELECT max(offer_id) FROM offer_last_seen"
+QUERY_PARAMS = {
+    "raw_offer_last_seen": {"offer_id": LAST_SEEN_OFFER_ID},
+    "mv_offer_last_seen": {"offer_id": LAST_SEEN_OFFER_ID},
+}
+_resolved_params = {}
+
+
+def query_sql(name: str) -> str:
+    # Текст запроса с уже подставленными параметрами: подзапрос за ключом не попадает в измеряемое время
+    sql = QUERIES[name]
+    params = QUERY_PARAMS.get(name)
+    if not params:
+        return sql
+    values = {}
+    for key, param_sql in params.items():
+        if param_sql not in _resolved_params:
+            _resolved_params[param_sql] = client.execute(param_sql)[0][0]
+        values[key] = _resolved_params[param_sql]
+    return sql % values
+
+
+# Approximate variants for dashboards: SAMPLE by the sampling key of ecom_offers, topK, uniqCombined.
+# exact - the raw query they are checked against, kind - how the error is measured
+APPROX_TOP_CATEGORIES = """
+SELECT
+    category_id,
+    round(count() * any(_sample_factor)) AS offers_cnt
+FROM ecom_offers SAMPLE 0.1
+GROUP BY category_id
+ORDER BY offers_cnt DESC
+LIMIT 20
+"""
+
+APPROX_TOP_BRANDS = """
+SELECT
+    vendor,
+    round(count() * any(_sample_factor)) AS offers_cnt
+FROM ecom_offers SAMPLE 0.1
+GROUP BY vendor
+ORDER BY offers_cnt DESC
+LIMIT 30
+"""
+
+APPROX_TOP_BRANDS_TOPK = """
+SELECT arrayJoin(topK(30)(vendor)) AS vendor
+FROM ecom_offers
+"""
+
+# avg(offers per brand) in a category = count() / number of brands, no nested GROUP BY
+APPROX_AVG_OFFERS_PER_BRAND = """
+SELECT
+    category_id,
+    count() / uniqCombined(vendor) AS avg_offers_per_brand
+FROM ecom_offers
+GROUP BY category_id
+ORDER BY avg_offers_per_brand DESC
+"""
+
+APPROX_OFFERS_WITHOUT_EVENTS = """
+SELECT
+    offer_id,
+    category_id,
+    vendor,
+    price
+FROM ecom_offers SAMPLE 0.1
+WHERE offer_id NOT IN
+(
+    SELECT offer_id
+    FROM offer_last_seen
+)
+"""
+
+APPROX_QUERIES = {
+    "approx_top_categories": {"sql": APPROX_TOP_CATEGORIES, "exact": "raw_top_categories", "kind": "topn"},
+    "approx_top_brands": {"sql": APPROX_TOP_BRANDS, "exact": "raw_top_brands", "kind": "topn"},
+    "approx_top_brands_topk": {"sql": APPROX_TOP_BRANDS_TOPK, "exact": "raw_top_brands", "kind": "topn"},
+    "approx_avg_offers_per_brand": {"sql": APPROX_AVG_OFFERS_PER_BRAND, "exact": "raw_avg_offers_per_brand",
+                                    "kind": "by_key"},
+    "approx_offers_without_events": {"sql": APPROX_OFFERS_WITHOUT_EVENTS, "exact": "raw_offers_without_events",
+                                     "kind": "rowcount", "scale": 10.0},
 }
 
 
-def run_benchmark(name: str, sql: str, iterations: int) -> None:
-    times = []
+def run_benchmark(name: str, sql: str, iterations: int, run_id: str = "", variant: str = "") -> list:
+    # В цикле только замер, весь вывод - после него
+    times = [0.0] * iterations
+    # query_id/log_comment помечают запросы прогона, чтобы потом найти их в system.query_log
+    settings = {"log_comment": run_id} if run_id else None
 
     log(f"\n=== Query {name} ===")
-    client.execute(sql)
+    client.execute(sql, settings=settings)
 
     for i in range(iterations):
+        query_id = f"{run_id}:{name}:{i}" if run_id else None
         t0 = time.perf_counter()
-        client.execute(sql)
-        dt = time.perf_counter() - t0
-        times.append(dt)
+        client.execute(sql, query_id=query_id, settings=settings)
+        times[i] = time.perf_counter() - t0
+
+    for i, dt in enumerate(times):
         log(f"  iteration {i + 1:2d}/{iterations}: {dt:.4f} s")
 
     log(f"\nResults for {name}:")
@@ -166,42 +356,919 @@ def run_benchmark(name: str, sql: str, iterations: int) -> None:
     log(f"  mean  = {mean(times):.4f} s")
     log(f"  max   = {max(times):.4f} s")
     log("-" * 40)
+    extra = {"variant": variant} if variant else {}
+    record_result(name, "sequential", times, metrics={"run_id": run_id}, **extra)
+    return times
 
 
+def _current_rss():
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
 
-def main():
-    global LOG_TXT, DOC
 
-    # Имя файлов со штампом времени, чтобы не перезатирать результаты
-    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    base_name = f"clickhouse_load_test_{timestamp}"
+class RssSampler:
+    # Пиковый RSS клиента за время запроса: фоновый поток опрашивает память процесса
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.baseline = None
+        self.peak = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
 
-    # Открываем txt-лог
-    LOG_TXT = open(base_name + ".txt", "w", encoding="utf-8")
+    def _sample(self) -> None:
+        rss = _current_rss()
+        if rss is not None:
+            self.peak = rss if self.peak is None else max(self.peak, rss)
 
-    # Готовим Word-документ, если библиотека доступна
-    if Document is not None:
-        DOC = Document()
-        DOC.add_heading("ClickHouse load test", level=1)
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def __enter__(self) -> "RssSampler":
+        self.baseline = _current_rss()
+        self.peak = self.baseline
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+
+    @property
+    def growth(self):
+        if self.baseline is None or self.peak is None:
+            return None
+        return self.peak - self.baseline
+
+
+def run_streaming(name: str, sql: str, iterations: int, run_id: str = "", block_size: int = 65536) -> list:
+    # execute() собирает весь результат в list of tuples; здесь строки читаются поблочно
+    # через execute_iter и сразу выбрасываются, так что память клиента ограничена блоком
+    settings = {"max_block_size": block_size}
+    if run_id:
+        settings["log_comment"] = run_id
+
+    log(f"\n=== Query {name} (streaming, block={block_size}) ===")
+    for _ in client.execute_iter(sql, settings=settings, chunk_size=block_size):
+        pass
+
+    times = [0.0] * iterations
+    first_row = [None] * iterations
+    rows = [0] * iterations
+    rss_growth = [None] * iterations
+
+    for i in range(iterations):
+        query_id = f"{run_id}:{name}:{i}" if run_id else None
+        n = 0
+        with RssSampler() as rss:
+            t0 = time.perf_counter()
+            for chunk in client.execute_iter(sql, query_id=query_id, settings=settings, chunk_size=block_size):
+                if first_row[i] is None and chunk:
+                    first_row[i] = time.perf_counter() - t0
+                n += len(chunk)
+            times[i] = time.perf_counter() - t0
+        rows[i] = n
+        rss_growth[i] = rss.growth
+
+    for i in range(iterations):
+        ttfr = f"{first_row[i]:.4f} s" if first_row[i] is not None else "n/a"
+        log(f"  iteration {i + 1:2d}/{iterations}: {times[i]:.4f} s, first row {ttfr}, {rows[i]} rows")
+
+    ttfrs = [t for t in first_row if t is not None]
+    growths = [g for g in rss_growth if g is not None]
+    log(f"\nResults for {name}:")
+    log(f"  total time    = {mean(times):.4f} s (mean), {min(times):.4f} .. {max(times):.4f} s")
+    if ttfrs:
+        log(f"  first row     = {mean(ttfrs):.4f} s (mean)")
+    log(f"  rows          = {rows[-1]}, {sum(rows) / sum(times):,.0f} rows/s")
+    if growths:
+        log(f"  peak RSS growth = {max(growths) / 2 ** 20:.1f} MiB")
+    log("-" * 40)
+    record_result(name, "streaming", times, metrics={"run_id": run_id}, block_size=block_size)
+    return times
+
+
+SERVER_METRICS_SQL = """
+SELECT
+    query_id,
+    dateDiff('microsecond', query_start_time_microseconds, event_time_microseconds) AS server_us,
+    read_rows,
+    read_bytes,
+    result_rows,
+    result_bytes,
+    memory_usage,
+    ProfileEvents['SelectedParts']                AS selected_parts,
+    ProfileEvents['SelectedMarks']                AS selected_marks,
+    ProfileEvents['OSCPUVirtualTimeMicroseconds'] AS cpu_us,
+    ProfileEvents['NetworkSendBytes']             AS network_send_bytes
+FROM system.query_log
+WHERE event_date >= yesterday()
+  AND type = 'QueryFinish'
+  AND log_comment = %(run_id)s
+"""
+
+SERVER_METRICS_COLUMNS = [
+    "query_id", "server_us", "read_rows", "read_bytes", "result_rows", "result_bytes",
+    "memory_usage", "selected_parts", "selected_marks", "cpu_us", "network_send_bytes",
+]
+
+
+def fetch_server_metrics(run_id: str, expected: int, timeout: float = 30.0) -> dict:
+    # query_log пишется на диск раз в flush_interval_milliseconds (7.5 s), поэтому либо
+    # просим сервер сбросить логи, либо ждём, пока все запросы прогона туда доедут
+    try:
+        client.execute("SYSTEM FLUSH LOGS")
+    except Exception:
+        pass
+
+    deadline = time.perf_counter() + timeout
+    while True:
+        rows = client.execute(SERVER_METRICS_SQL, {"run_id": run_id})
+        rows = [dict(zip(SERVER_METRICS_COLUMNS, r)) for r in rows if r[0].startswith(run_id + ":")]
+        if len(rows) >= expected or time.perf_counter() >= deadline:
+            break
+        time.sleep(1.0)
+
+    by_query = defaultdict(list)
+    for r in rows:
+        by_query[r["query_id"].split(":")[1]].append(r)
+    for rec in RESULTS:
+        if rec.get("run_id") == run_id and by_query.get(rec["name"]):
+            rec["server_latencies"] = [r["server_us"] / 1e6 for r in by_query[rec["name"]]]
+            rec["read_rows"] = mean(r["read_rows"] for r in by_query[rec["name"]])
+            rec["read_bytes"] = mean(r["read_bytes"] for r in by_query[rec["name"]])
+    return by_query
+
+
+def report_server_metrics(client_times: dict, server_rows: dict) -> None:
+    log("\n=== Server-side metrics (system.query_log) ===")
+    summary = {}
+    for name, times in client_times.items():
+        rows = server_rows.get(name, [])
+        if not rows:
+            log(f"\n{name}: no rows in system.query_log")
+            continue
+        client_s = mean(times)
+        server_s = mean(r["server_us"] for r in rows) / 1e6
+        read_rows = mean(r["read_rows"] for r in rows)
+        summary[name] = {"client": client_s, "server": server_s, "read_rows": read_rows}
+
+        log(f"\n{name} ({len(rows)}/{len(times)} queries found):")
+        log(f"  client time   = {client_s:.4f} s (mean, perf_counter)")
+        log(f"  server time   = {server_s:.4f} s (mean, query_log)")
+        log(f"  client-side   = {client_s - server_s:.4f} s (network + decoding)")
+        log(f"  read_rows     = {read_rows:.0f}")
+        log(f"  read_bytes    = {mean(r['read_bytes'] for r in rows):.0f}")
+        log(f"  result_rows   = {mean(r['result_rows'] for r in rows):.0f}")
+        log(f"  memory_usage  = {mean(r['memory_usage'] for r in rows):.0f} bytes")
+        log(f"  parts/marks   = {mean(r['selected_parts'] for r in rows):.0f} / {mean(r['selected_marks'] for r in rows):.0f}")
+        log(f"  server CPU    = {mean(r['cpu_us'] for r in rows) / 1e6:.4f} s")
+        if server_s > 0:
+            log(f"  scan rate     = {read_rows / server_s:,.0f} rows/s")
+
+    # Раскладываем ускорение raw -> MV на серверную и клиентскую часть
+    pairs = [(n, "mv_" + n[len("raw_"):]) for n in summary if n.startswith("raw_") and "mv_" + n[len("raw_"):] in summary]
+    if pairs:
+        log("\n=== Raw vs MV speedup ===")
+    for raw, mv in pairs:
+        r, m = summary[raw], summary[mv]
+        client_r, client_m = r["client"] - r["server"], m["client"] - m["server"]
+        log(f"\n{raw[len('raw_'):]}:")
+        log(f"  total speedup  = {r['client'] / m['client']:.2f}x")
+        if m["server"] > 0:
+            log(f"  server speedup = {r['server'] / m['server']:.2f}x")
+        if client_m > 0:
+            log(f"  client-side speedup = {client_r / client_m:.2f}x")
+        log(f"  read_rows      = {r['read_rows']:.0f} -> {m['read_rows']:.0f}")
+    log("-" * 40)
+
+
+def approx_error(kind: str, exact_rows: list, approx_rows: list, scale: float = 1.0) -> dict:
+    # rowcount: ошибка числа строк после домножения на 1/SAMPLE;
+    # topn/by_key: средняя относительная ошибка значений по общим ключам (+ recall ключей для top-N)
+    if kind == "rowcount":
+        estimate = len(approx_rows) * scale
+        return {"rel_error": abs(estimate - len(exact_rows)) / max(len(exact_rows), 1)}
+
+    exact = {r[0]: r[1] for r in exact_rows}
+    approx = {r[0]: (r[1] if len(r) > 1 else None) for r in approx_rows}
+    errors = [abs(v - exact[k]) / abs(exact[k]) for k, v in approx.items() if v is not None and exact.get(k)]
+    out = {"rel_error": mean(errors) if errors else None}
+    if kind == "topn":
+        out["recall"] = len(set(approx) & set(exact)) / len(exact) if exact else 1.0
+    return out
+
+
+def _time_query(sql: str, iterations: int, run_id: str = "", label: str = "") -> tuple:
+    settings = {"log_comment": run_id} if run_id else None
+    rows = client.execute(sql, settings=settings)
+    times = [0.0] * iterations
+    for i in range(iterations):
+        query_id = f"{run_id}:{label}:{i}" if run_id else None
+        t0 = time.perf_counter()
+        client.execute(sql, query_id=query_id, settings=settings)
+        times[i] = time.perf_counter() - t0
+    return times, rows
+
+
+def run_approx(name: str, spec: dict, iterations: int, run_id: str = "") -> None:
+    log(f"\n=== Query {name} (approximate, vs {spec['exact']}) ===")
+
+    # свой run_id на пару: несколько приближённых вариантов сравниваются с одним и тем же точным запросом
+    pair_id = f"{run_id}.{name}" if run_id else ""
+    exact_times, exact_rows = _time_query(query_sql(spec["exact"]), iterations, pair_id, spec["exact"])
+    approx_times, approx_rows = _time_query(spec["sql"], iterations, pair_id, name)
+    err = approx_error(spec["kind"], exact_rows, approx_rows, spec.get("scale", 1.0))
+
+    exact_p50 = percentile(sorted(exact_times), 50)
+    approx_p50 = percentile(sorted(approx_times), 50)
+    log(f"\nResults for {name}:")
+    log(f"  exact  p50 = {exact_p50:.4f} s ({spec['exact']})")
+    log(f"  approx p50 = {approx_p50:.4f} s")
+    if approx_p50 > 0:
+        log(f"  speedup    = {exact_p50 / approx_p50:.2f}x")
+    if err["rel_error"] is not None:
+        log(f"  mean relative error = {err['rel_error']:.2%}")
+    if "recall" in err:
+        log(f"  top-N recall        = {err['recall']:.0%}")
+    record_result(name, "approx", approx_times, metrics={**err, "run_id": pair_id}, exact=spec["exact"])
+
+    if pair_id:
+        # SAMPLE режет строки для агрегации, но не обязательно чтение: при category_id перед
+        # intHash32(offer_id) в ключе сортировки запрос без фильтра по категории почти не пропускает гранулы
+        server = fetch_server_metrics(pair_id, 2 * iterations)
+        exact_srv, approx_srv = server.get(spec["exact"], []), server.get(name, [])
+        if exact_srv and approx_srv:
+            exact_bytes = mean(r["read_bytes"] for r in exact_srv)
+            approx_bytes = mean(r["read_bytes"] for r in approx_srv)
+            log(f"  read_rows  exact / approx = {mean(r['read_rows'] for r in exact_srv):,.0f} / "
+                f"{mean(r['read_rows'] for r in approx_srv):,.0f}")
+            log(f"  read_bytes exact / approx = {exact_bytes:,.0f} / {approx_bytes:,.0f}"
+                + (f" ({approx_bytes / exact_bytes:.0%} of exact)" if exact_bytes else ""))
+        else:
+            log("  read_rows / read_bytes: no rows in system.query_log")
+    log("-" * 40)
+
+
+def apply_schema_variant(variant: str) -> None:
+    # variant - имя файла из clickhouse/variants или несколько через "+", baseline - схема init.sql
+    files = ["reset"] + [v for v in variant.split("+") if v != "baseline"]
+    admin = make_client(CLICKHOUSE_ADMIN_USER, CLICKHOUSE_ADMIN_PASSWORD)
+    for name in files:
+        for st in read_sql_statements(os.path.join(VARIANTS_DIR, name + ".sql")):
+            # MATERIALIZE/DROP - мутации, ждём их окончания, иначе меряем полупостроенную схему
+            admin.execute(st, settings={"mutations_sync": 1})
+    admin.disconnect()
+
+
+def run_variants(args) -> None:
+    summary = {}
+    try:
+        for variant in args.variants:
+            log(f"\n##### Schema variant: {variant} #####")
+            t0 = time.perf_counter()
+            apply_schema_variant(variant)
+            log(f"Schema applied in {time.perf_counter() - t0:.1f} s")
+
+            run_id = f"bench_{datetime.datetime.now():%Y%m%d_%H%M%S}_{random.getrandbits(32):08x}"
+            client_times = {}
+            for name in args.queries:
+                client_times[name] = run_benchmark(name, query_sql(name), args.iterations, run_id, variant)
+
+            expected = sum(len(t) for t in client_times.values())
+            server_rows = fetch_server_metrics(run_id, expected)
+            report_server_metrics(client_times, server_rows)
+
+            for name, times in client_times.items():
+                rows = server_rows.get(name, [])
+                summary[(name, variant)] = {
+                    "p50": percentile(sorted(times), 50),
+                    "server": mean(r["server_us"] for r in rows) / 1e6 if rows else float("nan"),
+                    "read_rows": mean(r["read_rows"] for r in rows) if rows else float("nan"),
+                    "read_bytes": mean(r["read_bytes"] for r in rows) if rows else float("nan"),
+                }
+    finally:
+        # Возвращаем схему init.sql и после ошибки / Ctrl-C: иначе проекции и skip-индексы
+        # варианта остаются и искажают все следующие замеры
+        apply_schema_variant("baseline")
+
+    log("\n=== Schema variants summary ===")
+    log(f"{'query':<28} {'variant':<26} {'p50, s':>8} {'server, s':>10} {'read_rows':>14} {'read_bytes':>16}")
+    for name in args.queries:
+        for variant in args.variants:
+            m = summary[(name, variant)]
+            log(f"{name:<28} {variant:<26} {m['p50']:>8.4f} {m['server']:>10.4f} "
+                f"{m['read_rows']:>14,.0f} {m['read_bytes']:>16,.0f}")
+    log("-" * 40)
+
+
+def percentile(sorted_times: list, p: float) -> float:
+    # nearest-rank, sorted_times уже отсортирован по возрастанию
+    if not sorted_times:
+        return float("nan")
+    k = max(0, min(len(sorted_times) - 1, math.ceil(p / 100.0 * len(sorted_times)) - 1))
+    return sorted_times[k]
+
+
+class LatencyHistogram:
+    # HDR-подобная гистограмма: логарифмические корзины с относительной погрешностью
+    # precision, память зависит от диапазона латентностей, а не от длины прогона.
+    # append() - как у списка, чтобы воркеры не различали режимы
+    def __init__(self, precision: float = 0.01, lowest: float = 1e-6):
+        self.precision = precision
+        self.lowest = lowest
+        self._log_base = math.log1p(precision)
+        self.counts = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def append(self, value: float) -> None:
+        idx = int(math.log(max(value, self.lowest) / self.lowest) / self._log_base)
+        self.counts[idx] = self.counts.get(idx, 0) + 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def merge(self, other: "LatencyHistogram") -> None:
+        for idx, c in other.counts.items():
+            self.counts[idx] = self.counts.get(idx, 0) + c
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def mean(self) -> float:
+        return self.total / self.count if self.count else float("nan")
+
+    def percentile(self, p: float) -> float:
+        if not self.count:
+            return float("nan")
+        rank = max(1, math.ceil(p / 100.0 * self.count))
+        seen = 0
+        for idx in sorted(self.counts):
+            seen += self.counts[idx]
+            if seen >= rank:
+                # верхняя граница корзины, но не больше реального максимума
+                return min(self.max, self.lowest * math.exp((idx + 1) * self._log_base))
+        return self.max
+
+    def to_dict(self) -> dict:
+        return {"precision": self.precision, "lowest": self.lowest, "count": self.count,
+                "total": self.total, "max": self.max, "counts": self.counts}
+
+
+def new_samples(histogram: bool):
+    return LatencyHistogram() if histogram else []
+
+
+def merge_samples(parts: list):
+    # parts - списки или гистограммы от отдельных воркеров
+    if parts and isinstance(parts[0], LatencyHistogram):
+        merged = LatencyHistogram()
+        for part in parts:
+            merged.merge(part)
+        return merged
+    return sorted(t for part in parts for t in part)
+
+
+def log_percentiles(samples, label: str = "") -> None:
+    # samples - отсортированный список или LatencyHistogram
+    if not len(samples):
+        return
+    if isinstance(samples, LatencyHistogram):
+        avg, pct, top = samples.mean(), samples.percentile, samples.max
     else:
-        DOC = None
+        avg, pct, top = mean(samples), lambda p: percentile(samples, p), samples[-1]
+    if label:
+        log(f"  {label}:")
+    log(f"  mean  = {avg:.4f} s")
+    log(f"  p50   = {pct(50):.4f} s")
+    log(f"  p95   = {pct(95):.4f} s")
+    log(f"  p99   = {pct(99):.4f} s")
+    log(f"  p99.9 = {pct(99.9):.4f} s")
+    log(f"  max   = {top:.4f} s")
 
-    log("Starting ClickHouse load test\n")
-    log(f"Host: {CLICKHOUSE_HOST}:{CLICKHOUSE_PORT}, database: {CLICKHOUSE_DB}")
-    log(f"Number of iterations per query: {ITERATIONS}\n")
+
+def _concurrent_worker(sql: str, duration: float, worker_qps, histogram: bool = False, cache=None) -> tuple:
+    # У каждого воркера своё соединение: один Client нельзя делить между потоками
+    worker_client = make_client()
+    worker_client.execute(sql)
+    if cache is not None:
+        execute = lambda: cache.execute(worker_client, sql)
+    else:
+        execute = lambda: worker_client.execute(sql)
+
+    times = new_samples(histogram)
+    errors = 0
+    interval = 1.0 / worker_qps if worker_qps else 0.0
+    start = time.perf_counter()
+    deadline = start + duration
+    next_send = start
+
+    while True:
+        now = time.perf_counter()
+        if now >= deadline:
+            break
+        if interval:
+            if next_send > now:
+                time.sleep(next_send - now)
+            next_send += interval
+        t0 = time.perf_counter()
+        try:
+            execute()
+        except Exception:
+            errors += 1
+            continue
+        times.append(time.perf_counter() - t0)
+
+    elapsed = time.perf_counter() - start
+    worker_client.disconnect()
+    return times, errors, elapsed
+
+
+def run_concurrent(name: str, sql: str, workers: int, duration: float, qps=None, processes: bool = False,
+                   histogram: bool = False, cache=None) -> None:
+    log(f"\n=== Query {name} (workers={workers}, qps={qps or 'max'}{', cached' if cache else ''}) ===")
+
+    worker_qps = qps / workers if qps else None
+    executor_cls = ProcessPoolExecutor if processes else ThreadPoolExecutor
+    with executor_cls(max_workers=workers) as pool:
+        futures = [pool.submit(_concurrent_worker, sql, duration, worker_qps, histogram, cache) for _ in range(workers)]
+        results = [f.result() for f in futures]
+
+    times = merge_samples([r[0] for r in results])
+    errors = sum(r[1] for r in results)
+    elapsed = max(r[2] for r in results)
+
+    log(f"\nResults for {name}:")
+    log(f"  requests   = {len(times)} ok, {errors} errors")
+    log(f"  throughput = {len(times) / elapsed:.1f} qps")
+    if cache is not None:
+        st = cache.stats()
+        log(f"  cache      = hit ratio {st['hit_ratio']:.1%} ({st['hits']} hits, {st['coalesced']} coalesced, "
+            f"{st['misses']} misses, {st['invalidations']} invalidations)")
+    log_percentiles(times)
+    log("-" * 40)
+    extra = {"cache": True} if cache is not None else {}
+    record_result(name, "concurrent", times, errors, workers=workers, qps=qps, **extra)
+
+
+def arrival_schedule(rate: float, duration: float, arrival: str, seed: int = 42) -> list:
+    # Смещения (в секундах от старта), в которые запрос *должен* уйти на сервер
+    rnd = random.Random(seed)
+    offsets = []
+    t = 0.0
+    while True:
+        t += rnd.expovariate(rate) if arrival == "poisson" else 1.0 / rate
+        if t >= duration:
+            return offsets
+        offsets.append(t)
+
+
+def _open_loop_worker(sql: str, schedule: list, slots, start: float, histogram: bool = False) -> tuple:
+    worker_client = make_client()
+    worker_client.execute(sql)
+
+    latencies = new_samples(histogram)
+    service_times = new_samples(histogram)
+    errors = 0
+    max_lag = 0.0
+
+    while True:
+        i = next(slots)
+        if i >= len(schedule):
+            break
+        intended = start + schedule[i]
+        now = time.perf_counter()
+        if intended > now:
+            time.sleep(intended - now)
+        t0 = time.perf_counter()
+        max_lag = max(max_lag, t0 - intended)
+        try:
+            worker_client.execute(sql)
+        except Exception:
+            errors += 1
+            continue
+        t1 = time.perf_counter()
+        # Латентность считаем от запланированного момента отправки, а не от фактического:
+        # если все воркеры заняты и запрос ушёл позже, ожидание в очереди тоже попадает в замер
+        latencies.append(t1 - intended)
+        service_times.append(t1 - t0)
+
+    worker_client.disconnect()
+    return latencies, service_times, errors, max_lag
+
+
+def run_open_loop(name: str, sql: str, rate: float, duration: float, arrival: str, max_inflight: int,
+                  histogram: bool = False) -> None:
+    log(f"\n=== Query {name} (open loop, {arrival}, rate={rate} qps, max in-flight={max_inflight}) ===")
+
+    schedule = arrival_schedule(rate, duration, arrival)
+    slots = itertools.count()
+    # Старт с запасом, чтобы все воркеры успели подключиться и прогреться
+    start = time.perf_counter() + 1.0
+    with ThreadPoolExecutor(max_workers=max_inflight) as pool:
+        futures = [pool.submit(_open_loop_worker, sql, schedule, slots, start, histogram) for _ in range(max_inflight)]
+        results = [f.result() for f in futures]
+    elapsed = time.perf_counter() - start
+
+    latencies = merge_samples([r[0] for r in results])
+    service_times = merge_samples([r[1] for r in results])
+    errors = sum(r[2] for r in results)
+    max_lag = max(r[3] for r in results)
+
+    log(f"\nResults for {name}:")
+    log(f"  scheduled  = {len(schedule)} requests, offered {len(schedule) / duration:.1f} qps")
+    log(f"  requests   = {len(latencies)} ok, {errors} errors")
+    log(f"  throughput = {len(latencies) / elapsed:.1f} qps")
+    log(f"  max send lag = {max_lag:.4f} s")
+    log_percentiles(latencies, "latency from intended send time")
+    log_percentiles(service_times, "service time")
+    log("-" * 40)
+    record_result(name, "open-loop", latencies, errors, rate=rate, arrival=arrival, max_inflight=max_inflight)
+
+
+async def _async_query(session, sql: str, intended: float, stats: dict) -> None:
+    stats["inflight"] += 1
+    stats["max_inflight"] = max(stats["max_inflight"], stats["inflight"])
+    try:
+        async with session.post("/", data=sql.encode("utf-8"), params={"database": CLICKHOUSE_DB}) as resp:
+            body = await resp.read()
+            if resp.status != 200:
+                raise RuntimeError(body[:200].decode("utf-8", "replace"))
+    except Exception:
+        stats["errors"] += 1
+        return
+    finally:
+        stats["inflight"] -= 1
+    stats["latencies"].append(time.perf_counter() - intended)
+
+
+async def _run_async(sql: str, schedule: list, max_inflight: int, histogram: bool = False) -> dict:
+    stats = {"latencies": new_samples(histogram), "errors": 0, "inflight": 0, "max_inflight": 0, "max_lag": 0.0}
+    # Пул соединений ограничен max_inflight, всё что сверху ждёт свободное соединение,
+    # и это ожидание попадает в латентность (она считается от запланированного момента)
+    connector = aiohttp.TCPConnector(limit=max_inflight)
+    headers = {"X-ClickHouse-User": CLICKHOUSE_USER, "X-ClickHouse-Key": CLICKHOUSE_PASSWORD}
+    async with aiohttp.ClientSession(f"http://{CLICKHOUSE_HOST}:{CLICKHOUSE_HTTP_PORT}", connector=connector,
+                                     headers=headers, timeout=aiohttp.ClientTimeout(total=None)) as session:
+        async with session.post("/", data=sql.encode("utf-8"), params={"database": CLICKHOUSE_DB}) as resp:
+            await resp.read()
+
+        tasks = []
+        start = time.perf_counter()
+        for offset in schedule:
+            intended = start + offset
+            delay = intended - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            stats["max_lag"] = max(stats["max_lag"], time.perf_counter() - intended)
+            tasks.append(asyncio.create_task(_async_query(session, sql, intended, stats)))
+        await asyncio.gather(*tasks)
+        stats["elapsed"] = time.perf_counter() - start
+    return stats
+
+
+def run_async(name: str, sql: str, rate: float, duration: float, arrival: str, max_inflight: int,
+              histogram: bool = False) -> None:
+    if aiohttp is None:
+        raise SystemExit("async mode needs aiohttp: pip install aiohttp")
+
+    log(f"\n=== Query {name} (async HTTP, {arrival}, rate={rate} qps, pool={max_inflight}) ===")
+
+    schedule = arrival_schedule(rate, duration, arrival)
+    stats = asyncio.run(_run_async(sql, schedule, max_inflight, histogram))
+    latencies = merge_samples([stats["latencies"]])
+
+    log(f"\nResults for {name}:")
+    log(f"  scheduled  = {len(schedule)} requests, offered {len(schedule) / duration:.1f} qps")
+    log(f"  requests   = {len(latencies)} ok, {stats['errors']} errors")
+    log(f"  throughput = {len(latencies) / stats['elapsed']:.1f} qps")
+    log(f"  max in flight = {stats['max_inflight']}, max send lag = {stats['max_lag']:.4f} s")
+    log_percentiles(latencies, "latency from intended send time")
+    log("-" * 40)
+    record_result(name, "async", latencies, stats["errors"], rate=rate, arrival=arrival, max_inflight=max_inflight)
+
+
+# Scenario: взвешенная смесь запросов и вставок из TOML-файла (см. scenarios/mixed.toml)
+
+DEVICE_TYPES = ["mobile", "desktop", "tablet"]
+APPLICATIONS = ["app", "web", "mobile_web"]
+OS_NAMES = ["Android", "iOS", "Windows", "macOS", "Linux"]
+PROVINCES = ["Москва", "Санкт-Петербург", "Новосибирская область", "Свердловская область", "Краснодарский край"]
+
+
+def gen_raw_events_rows(rnd: random.Random, n: int, offer_ids: list) -> list:
+    hour = datetime.datetime.now().replace(minute=0, second=0, microsecond=0)
+    return [
+        (hour, rnd.choice(DEVICE_TYPES), rnd.choice(APPLICATIONS), rnd.choice(OS_NAMES),
+         rnd.choice(PROVINCES), rnd.choice(offer_ids))
+        for _ in range(n)
+    ]
+
+
+ROW_GENERATORS = {
+    "raw_events": (
+        "INSERT INTO raw_events (Hour, DeviceTypeName, ApplicationName, OSName, ProvinceName, ContentUnitID) VALUES",
+        gen_raw_events_rows,
+    ),
+}
+
+
+def load_scenario(path: str) -> dict:
+    # TOML нужен только сценариям: без tomli на Python 3.10 остальные режимы работают
+    try:
+        import tomllib
+    except ImportError:  # Python 3.10
+        try:
+            import tomli as tomllib
+        except ImportError:
+            raise SystemExit("--scenario on Python 3.10 needs tomli: pip install tomli")
+    with open(path, "rb") as f:
+        sc = tomllib.load(f)
+
+    sc.setdefault("name", path)
+    sc.setdefault("duration", 60.0)
+    sc.setdefault("concurrency", 8)
+    sc.setdefault("rate", None)
+    sc.setdefault("seed", 42)
+    entries = sc.get("queries", [])
+    if not entries:
+        raise SystemExit(f"Scenario {path}: no [[queries]] entries")
+
+    for e in entries:
+        if "name" not in e:
+            raise SystemExit(f"Scenario {path}: every [[queries]] entry needs a name")
+        e.setdefault("kind", "select")
+        e.setdefault("weight", 1.0)
+        e.setdefault("params", {})
+        if e["kind"] == "insert":
+            if e.get("table") not in ROW_GENERATORS:
+                raise SystemExit(f"Scenario {path}: insert entry {e['name']!r} needs table in {list(ROW_GENERATORS)}")
+            e.setdefault("rows", 1000)
+        else:
+            if "sql" not in e:
+                if e["name"] not in QUERIES:
+                    raise SystemExit(f"Scenario {path}: entry {e['name']!r} has no sql and is not in QUERIES")
+                e["sql"] = query_sql(e["name"])
+    return sc
+
+
+def _execute_entry(worker_client: Client, entry: dict, rnd: random.Random, offer_ids: list) -> int:
+    # Возвращает число вставленных строк (0 для SELECT)
+    if entry["kind"] == "insert":
+        insert_sql, gen_rows = ROW_GENERATORS[entry["table"]]
+        rows = gen_rows(rnd, entry["rows"], offer_ids)
+        worker_client.execute(insert_sql, rows)
+        return len(rows)
+    params = {k: rnd.choice(v) if isinstance(v, list) else v for k, v in entry["params"].items()}
+    worker_client.execute(entry["sql"], params or None)
+    return 0
+
+
+def _scenario_worker(sc: dict, worker_id: int, offer_ids: list, schedule, slots, start: float,
+                     histogram: bool = False) -> dict:
+    worker_client = make_client()
+    rnd = random.Random(sc["seed"] + worker_id)
+    entries = sc["queries"]
+    weights = [e["weight"] for e in entries]
+
+    stats = defaultdict(lambda: {"times": new_samples(histogram), "errors": 0, "rows": 0})
+    deadline = start + sc["duration"]
+    now = time.perf_counter()
+    if start > now:
+        time.sleep(start - now)
+
+    while True:
+        if schedule is not None:
+            i = next(slots)
+            if i >= len(schedule):
+                break
+            intended = start + schedule[i]
+            now = time.perf_counter()
+            if intended > now:
+                time.sleep(intended - now)
+        else:
+            intended = time.perf_counter()
+            if intended >= deadline:
+                break
+
+        entry = rnd.choices(entries, weights)[0]
+        st = stats[entry["name"]]
+        try:
+            st["rows"] += _execute_entry(worker_client, entry, rnd, offer_ids)
+        except Exception:
+            st["errors"] += 1
+            continue
+        st["times"].append(time.perf_counter() - intended)
+
+    worker_client.disconnect()
+    return dict(stats)
+
+
+def run_scenario(sc: dict, histogram: bool = False) -> None:
+    rate = sc["rate"]
+    log(f"\n=== Scenario {sc['name']} (duration={sc['duration']} s, concurrency={sc['concurrency']}, "
+        f"rate={rate or 'closed loop'}) ===")
+    for e in sc["queries"]:
+        extra = f", rows={e['rows']}" if e["kind"] == "insert" else ""
+        log(f"  {e['name']}: {e['kind']}, weight={e['weight']}{extra}")
+
+    offer_ids = []
+    if any(e["kind"] == "insert" for e in sc["queries"]):
+        # ContentUnitID берём из реального каталога, иначе все события достанутся несуществующим офферам
+        offer_ids = [r[0] for r in client.execute(sc.get("offer_ids_sql", "SELECT offer_id FROM ecom_offers LIMIT 100000"))]
+        if not offer_ids:
+            raise SystemExit("ecom_offers is empty, nothing to generate raw_events from")
+
+    schedule = arrival_schedule(rate, sc["duration"], sc.get("arrival", "poisson"), sc["seed"]) if rate else None
+    slots = itertools.count()
+    start = time.perf_counter() + 1.0
+    with ThreadPoolExecutor(max_workers=sc["concurrency"]) as pool:
+        futures = [pool.submit(_scenario_worker, sc, w, offer_ids, schedule, slots, start, histogram)
+                   for w in range(sc["concurrency"])]
+        results = [f.result() for f in futures]
+    elapsed = time.perf_counter() - start
+
+    for e in sc["queries"]:
+        name = e["name"]
+        times = merge_samples([r[name]["times"] for r in results if name in r])
+        errors = sum(r.get(name, {}).get("errors", 0) for r in results)
+        rows = sum(r.get(name, {}).get("rows", 0) for r in results)
+
+        log(f"\nResults for {name}:")
+        log(f"  requests   = {len(times)} ok, {errors} errors")
+        log(f"  throughput = {len(times) / elapsed:.1f} qps")
+        if e["kind"] == "insert":
+            log(f"  inserted   = {rows} rows, {rows / elapsed:.0f} rows/s")
+        log_percentiles(times)
+        record_result(name, "scenario", times, errors, scenario=sc["name"])
+    log("-" * 40)
+
+
+def _git_commit() -> str:
+    repo = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=repo,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=repo,
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return commit + ("-dirty" if dirty else "")
+
+
+def server_fingerprint() -> dict:
+    # Версия сервера + хэш изменённых настроек и схемы таблиц: если он отличается,
+    # сравнение двух прогонов - это сравнение разных конфигураций
+    version = client.execute("SELECT version()")[0][0]
+    settings = client.execute("SELECT name, value FROM system.settings WHERE changed ORDER BY name")
+    tables = client.execute(
+        "SELECT name, create_table_query FROM system.tables WHERE database = currentDatabase() ORDER BY name"
+    )
+    h = hashlib.sha256(json.dumps([settings, tables], ensure_ascii=False, default=str).encode("utf-8"))
+    return {"server_version": version, "config_fingerprint": h.hexdigest()[:16]}
+
+
+def write_results(path: str, args, timestamp: str) -> None:
+    header = {
+        "type": "run",
+        "timestamp": timestamp,
+        "git_commit": _git_commit(),
+        "host": f"{CLICKHOUSE_HOST}:{CLICKHOUSE_PORT}",
+        "database": CLICKHOUSE_DB,
+        "args": vars(args),
+    }
+    try:
+        header.update(server_fingerprint())
+    except Exception as e:
+        header["server_version"] = f"unavailable: {e}"
+    with open(path, "w", encoding="utf-8") as f:
+        for rec in [header] + RESULTS:
+            f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+
+
+def parse_args():
+    ap = argparse.ArgumentParser(description="ClickHouse load test")
+    ap.add_argument("--mode", choices=["sequential", "streaming", "concurrent", "open-loop", "async", "approx", "variants"], default="sequential")
+    ap.add_argument("--iterations", type=int, default=ITERATIONS, help="sequential/streaming/approx/variants mode: runs per query")
+    ap.add_argument("--block-size", type=int, default=65536, help="streaming mode: rows per block (max_block_size), at least 2")
+    ap.add_argument("--workers", type=int, nargs="+", default=[1, 4, 16],
+                    help="concurrent mode: number of workers, several values give a sweep")
+    ap.add_argument("--duration", type=float, default=30.0, help="concurrent/open-loop mode: seconds per query and load level")
+    ap.add_argument("--qps", type=float, default=None, help="concurrent mode: target total QPS (default: as fast as possible)")
+    ap.add_argument("--processes", action="store_true", help="concurrent mode: processes instead of threads")
+    ap.add_argument("--cache", action="store_true",
+                    help="concurrent mode: run every level a second time through a shared QueryCache (ch_cache.py)")
+    ap.add_argument("--cache-ttl", type=float, default=60.0, help="concurrent mode: QueryCache TTL in seconds")
+    ap.add_argument("--rate", type=float, nargs="+", default=[10.0],
+                    help="open-loop/async mode: arrival rate in qps, several values give a sweep")
+    ap.add_argument("--arrival", choices=["constant", "poisson"], default="poisson", help="open-loop/async mode: arrival process")
+    ap.add_argument("--max-inflight", type=int, default=64,
+                    help="open-loop mode: connections sending the schedule; async mode: HTTP connection pool size")
+    ap.add_argument("--queries", nargs="+", choices=list(QUERIES), default=list(QUERIES))
+    ap.add_argument("--variants", nargs="+",
+                    default=["baseline", "projections", "skip_indexes", "projections+skip_indexes"],
+                    help="variants mode: schema variants from clickhouse/variants, combine with '+'")
+    ap.add_argument("--histogram", action="store_true",
+                    help="aggregate latencies of concurrent/open-loop/async/scenario runs in a histogram "
+                         "(flat memory on long runs, ~1%% precision) instead of keeping every sample")
+    ap.add_argument("--no-server-metrics", action="store_true",
+                    help="sequential/streaming/approx mode: do not read server time and read_rows from system.query_log")
+    ap.add_argument("--scenario", help="TOML scenario file with a weighted query/insert mix (overrides --mode)")
+    ap.add_argument("--output", default=None,
+                    help="base name of the result files (default: clickhouse_load_test_YYYYMMDD_HHMMSS)")
+    args = ap.parse_args()
+    if args.block_size < 2:
+        # execute_iter отдаёт списки строк только при chunk_size > 1, при 1 - отдельные строки
+        ap.error("--block-size must be at least 2")
+    return args
+
+
+def run_queries(args) -> None:
+    if args.mode == "sequential":
+        log(f"Number of iterations per query: {args.iterations}\n")
+    elif args.mode == "streaming":
+        log(f"Streaming mode: iterations per query: {args.iterations}, block size: {args.block_size}\n")
+    elif args.mode == "approx":
+        log(f"Approximate mode: iterations per query: {args.iterations}\n")
+    elif args.mode == "variants":
+        log(f"Schema variants: {args.variants}, iterations per query: {args.iterations}\n")
+    elif args.mode == "concurrent":
+        log(f"Concurrent mode: workers={args.workers}, duration={args.duration} s, "
+            f"qps={args.qps or 'max'}, {'processes' if args.processes else 'threads'}\n")
+    else:
+        log(f"{'Async HTTP' if args.mode == 'async' else 'Open-loop'} mode: rate={args.rate} qps, "
+            f"arrival={args.arrival}, duration={args.duration} s, max in-flight={args.max_inflight}\n")
+
+    if args.mode == "variants":
+        # сам переключает схему и гоняет sequential-прогоны по каждому варианту
+        run_variants(args)
+        return
+
+    run_id = "" if args.no_server_metrics else f"bench_{datetime.datetime.now():%Y%m%d_%H%M%S}_{random.getrandbits(32):08x}"
+    client_times = {}
 
     # Гоним все запросы
-    for name, sql in QUERIES.items():
-        run_benchmark(name, sql, ITERATIONS)
+    for name in args.queries:
+        sql = query_sql(name)
+        if args.mode == "sequential":
+            client_times[name] = run_benchmark(name, sql, args.iterations, run_id)
+        elif args.mode == "streaming":
+            client_times[name] = run_streaming(name, sql, args.iterations, run_id, args.block_size)
+        elif args.mode == "approx":
+            for approx_name, spec in APPROX_QUERIES.items():
+                if spec["exact"] == name:
+                    run_approx(approx_name, spec, args.iterations, run_id)
+        elif args.mode == "concurrent":
+            for workers in args.workers:
+                run_concurrent(name, sql, workers, args.duration, args.qps, args.processes, args.histogram)
+                if args.cache:
+                    # Свежий кэш на каждый прогон: первый запрос честно промахивается
+                    run_concurrent(name, sql, workers, args.duration, args.qps, False, args.histogram,
+                                   QueryCache(ttl=args.cache_ttl))
+        elif args.mode == "open-loop":
+            for rate in args.rate:
+                run_open_loop(name, sql, rate, args.duration, args.arrival, args.max_inflight, args.histogram)
+        else:
+            for rate in args.rate:
+                run_async(name, sql, rate, args.duration, args.arrival, args.max_inflight, args.histogram)
+
+    if client_times and run_id:
+        expected = sum(len(t) for t in client_times.values())
+        report_server_metrics(client_times, fetch_server_metrics(run_id, expected))
 
-    # Закрываем txt
-    LOG_TXT.close()
 
-    # Сохраняем Word, если делали
-    if DOC is not None:
-        DOC.save(base_name + ".docx")
+def main():
+    args = parse_args()
+    scenario = load_scenario(args.scenario) if args.scenario else None
+
+    # Имя файлов со штампом времени, чтобы не перезатирать результаты
+    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    base_name = args.output or f"clickhouse_load_test_{timestamp}"
+
+    log("Starting ClickHouse load test\n")
+    log(f"Host: {CLICKHOUSE_HOST}:{CLICKHOUSE_PORT}, database: {CLICKHOUSE_DB}")
+    try:
+        if scenario is not None:
+            run_scenario(scenario, args.histogram)
+        else:
+            run_queries(args)
+    finally:
+        # Отчёты собираем только после замеров (и даже если прогон упал на середине)
+        write_results(base_name + ".jsonl", args, timestamp)
+        saved = render_report(base_name)
 
-    log(f"\nResults saved to: {base_name}.txt" + (" and .docx" if DOC is not None else ""))
+    print(f"\nResults saved to: {', '.join(saved + [base_name + '.jsonl'])}")
 
 
 